@@ -3,26 +3,55 @@ from __future__ import annotations
 
 import eventlet
 eventlet.monkey_patch()
+import eventlet.event
 
 import os
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
 from urllib.parse import urlparse
+from array import array
 import time
 from functools import lru_cache
-import concurrent.futures
+from typing import Iterator, NamedTuple
+import atexit
 import base64
+import bisect
+import fnmatch
+import gc
+import gzip
+import hashlib
 import io
+import itertools
+import json
+import math
+import mmap
+import re
+import secrets
 import shlex
+import ssl
+import struct
+import subprocess
+import sys
+import tracemalloc
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 
 import urllib3
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import threading
 import paramiko
+import simple_websocket
 from flask_socketio import SocketIO, emit
 from dotenv import load_dotenv
 from flask import Flask, jsonify, render_template
 
+try:
+    import fcntl
+except ImportError:  # Not on Windows; the metric store and recorder then skip their file locks
+    fcntl = None
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -31,6 +60,9 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 
 log_dir = Path(__file__).parent / "logs"
 log_dir.mkdir(exist_ok=True)
+# Small state files that should survive restarts (point at a volume in Docker)
+data_dir = Path(os.getenv("DATA_DIR", "").strip() or log_dir)
+data_dir.mkdir(parents=True, exist_ok=True)
 log_file = log_dir / "app.log"
 file_handler = RotatingFileHandler(log_file, maxBytes=1_000_000, backupCount=3)
 file_handler.setLevel("INFO")
@@ -68,9 +100,34 @@ SPEC_POOL1_TEXT = os.getenv("SPEC_POOL1_TEXT", "4x 8TB HDD").strip()
 SPEC_POOL2_TEXT = os.getenv("SPEC_POOL2_TEXT", "2x 1TB NVMe").strip()
 SPEC_GPU_TEXT = os.getenv("SPEC_GPU_TEXT", "NVIDIA Tesla P4 8GB").strip()
 
+
+def _parse_dashboard_datasets(raw: str) -> list[tuple[str, str]]:
+    """`/mnt/storage=Label,tank/media` -> [(key, label)]; keys are mountpoints or dataset names."""
+    panels = []
+    for entry in raw.split(","):
+        key, _, label = entry.strip().partition("=")
+        key = key.strip()
+        if not key:
+            continue
+        label = label.strip() or (f"{os.path.basename(key.rstrip('/'))} ({key})" if key.startswith("/") else key)
+        panels.append((key, label))
+    return panels
+
+
+# Storage panels: comma-separated mountpoints or dataset names, each optionally "=Label"
+DASHBOARD_DATASETS = _parse_dashboard_datasets(
+    os.getenv("DASHBOARD_DATASETS", "").strip()
+    or "/mnt/storage=storage (/mnt/storage),/mnt/Apps=Apps (/mnt/Apps)"
+)
+
 TRUENAS_INTERFACE_NET1 = os.getenv("TRUENAS_INTERFACE_NET1", "eno1").strip()
 TRUENAS_INTERFACE_NET2 = os.getenv("TRUENAS_INTERFACE_NET2", "enp3s0").strip()
 
+# Background collector cadence (seconds) and how long the very first /api/metrics
+# request may wait for the first sample.
+METRICS_INTERVAL = max(0.5, float(os.getenv("METRICS_INTERVAL", "2").strip() or "2"))
+METRICS_FIRST_WAIT = 8.0
+
 APPS_CONFIG = [
     {
         "category": "Media",
@@ -122,6 +179,9 @@ APPS_CONFIG = [
 
 CACHE_DURATION_DATASETS = 60
 CACHE_DURATION_DISKS = 300
+# Pool health is shown live, so keep it short; pool.query events over the TrueNAS
+# WebSocket drop the entry as soon as a pool changes.
+CACHE_DURATION_POOLS = 10
 
 if TRUENAS_VERIFY_SSL in {"false", "0", "no"} or NETDATA_VERIFY_SSL in {"false", "0", "no"}:
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -142,61 +202,890 @@ def _build_headers() -> dict[str, str]:
     return {"Authorization": f"Bearer {TRUENAS_API_KEY}"}
 
 
+# --- Instrumentation ---
+# Minimal Prometheus text-format primitives (no client library needed). Updates are
+# plain dict/list operations on the green-thread hub, so they are cheap enough to
+# leave on in production; /metrics renders them on scrape.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _prom_escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_prom_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class PromCounter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> Iterator[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_prom_labels(self.labelnames, labels)} {value}"
+
+
+class PromGauge(PromCounter):
+    kind = "gauge"
+
+    def set(self, *labels, value: float) -> None:
+        self._values[labels] = value
+
+    def dec(self, *labels, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class PromHistogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, *labels, value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe the block's duration, with an extra trailing outcome label (ok / error)."""
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            yield
+            outcome = "ok"
+        finally:
+            self.observe(*labels, outcome, value=time.perf_counter() - started)
+
+    def render(self) -> Iterator[str]:
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_prom_labels(self.labelnames + ('le',), labels + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_prom_labels(self.labelnames, labels)} {series[-1]}"
+            yield f"{self.name}_count{_prom_labels(self.labelnames, labels)} {cumulative}"
+
+
+def _prom_family(metric) -> Iterator[str]:
+    yield f"# HELP {metric.name} {metric.help}"
+    yield f"# TYPE {metric.name} {metric.kind}"
+    yield from metric.render()
+
+
+_upstream_seconds = PromHistogram(
+    "truenas_dash_upstream_request_seconds",
+    "Latency of calls to TrueNAS, Netdata and SSH.",
+    ("upstream", "path", "outcome"),
+)
+_http_seconds = PromHistogram(
+    "truenas_dash_http_request_seconds",
+    "Latency of dashboard HTTP endpoints.",
+    ("endpoint", "method", "status"),
+)
+_http_in_flight = PromGauge(
+    "truenas_dash_http_requests_in_flight",
+    "HTTP requests currently being handled.",
+)
+_http_in_flight.set(value=0)
+_net_stats_cache_events = PromCounter(
+    "truenas_dash_net_stats_cache_total",
+    "Lookups in the TrueNAS interface stats cache.",
+    ("result",),
+)
+
+
+def _ssh_command_label(cmd: str) -> str:
+    """Program name for metrics labels: `sudo -S -p '' smartctl -a /dev/sda` -> smartctl."""
+    for token in cmd.split():
+        if token in ("sudo", "''", '""') or token.startswith("-"):
+            continue
+        return os.path.basename(token)[:32]
+    return "unknown"
+
+
+# --- Circuit Breakers ---
+# One breaker per upstream. After CIRCUIT_FAILURE_THRESHOLD consecutive failures it
+# opens and calls fail immediately with CircuitOpenError; after a cooldown a single
+# half-open probe is let through, which closes the breaker or reopens it with twice
+# the cooldown. Timeouts follow observed latency: p99 of the last calls to the same
+# path times CIRCUIT_TIMEOUT_FACTOR, kept within the upstream's bounds, so a fast
+# endpoint that stops answering costs ~1 s, not 5. Paths with too few samples (rare,
+# possibly slow ones like pool/dataset) keep the default timeout.
+CIRCUIT_FAILURE_THRESHOLD = max(1, int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5").strip() or "5"))
+CIRCUIT_RESET_TIMEOUT = max(1.0, float(os.getenv("CIRCUIT_RESET_TIMEOUT", "5").strip() or "5"))
+CIRCUIT_MAX_RESET_TIMEOUT = 60.0
+CIRCUIT_TIMEOUT_FACTOR = 3.0
+CIRCUIT_LATENCY_WINDOW = 100
+CIRCUIT_MIN_SAMPLES = 20
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling an upstream whose breaker is open.
+
+    Subclasses ConnectionError so existing upstream error handling treats it like
+    an unreachable host.
+    """
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, default_timeout: float, min_timeout: float, is_failure):
+        self.name = name
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.is_failure = is_failure
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.cooldown = CIRCUIT_RESET_TIMEOUT
+        self.last_error = ""
+        self._probing = False
+        self._latency: dict[str, deque] = {}
+        self._timed_out: set[str] = set()  # keys whose last call timed out
+        self.trips = 0
+        self.rejected = 0
+
+    def timeout(self, key: str = "") -> float:
+        samples = self._latency.get(key)
+        if samples is None or len(samples) < CIRCUIT_MIN_SAMPLES:
+            return self.default_timeout
+        ordered = sorted(samples)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        return min(self.default_timeout, max(self.min_timeout, p99 * CIRCUIT_TIMEOUT_FACTOR))
+
+    def timeout_for(self, key: str = "") -> float:
+        """Timeout for the next call: adaptive, except for half-open probes and retries
+        after a timeout, which get the full default so a slowed-down upstream can still
+        answer (and raise the learned p99) instead of tripping the breaker for good."""
+        if self.state != "closed" or key in self._timed_out:
+            return self.default_timeout
+        return self.timeout(key)
+
+    def _observe(self, key: str, latency: float) -> None:
+        self._latency.setdefault(key, deque(maxlen=CIRCUIT_LATENCY_WINDOW)).append(latency)
+
+    def _before(self) -> None:
+        if self.state == "closed":
+            return
+        if self.state == "open" and time.time() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError(f"{self.name} circuit open ({self.last_error})")
+
+    def _success(self) -> None:
+        self.failures = 0
+        if self.state != "closed":
+            app.logger.info(f"{self.name} circuit closed")
+            self.state = "closed"
+            self.cooldown = CIRCUIT_RESET_TIMEOUT
+        self._probing = False
+
+    def _failure(self, exc: BaseException) -> None:
+        self.failures += 1
+        self.last_error = f"{type(exc).__name__}: {exc}"[:200]
+        if self.state == "half_open":
+            self.cooldown = min(self.cooldown * 2, CIRCUIT_MAX_RESET_TIMEOUT)
+            self._open()
+        elif self.state == "closed" and self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+            self._open()
+        self._probing = False
+
+    def _open(self) -> None:
+        self.state = "open"
+        self.opened_at = time.time()
+        self.trips += 1
+        app.logger.warning(
+            f"{self.name} circuit open after {self.failures} failures, retrying in {self.cooldown:.0f}s: {self.last_error}"
+        )
+
+    @contextmanager
+    def guard(self):
+        """Fail fast while open; turn the block's outcome into a breaker verdict."""
+        self._before()
+        try:
+            yield
+        except BaseException as e:
+            if not isinstance(e, Exception):
+                # cancelled (fan-out deadline, green thread kill): no verdict either way
+                self._probing = False
+            elif self.is_failure(e):
+                self._failure(e)
+            else:
+                # the upstream answered, just not with what the caller wanted
+                self._success()
+            raise
+        self._success()
+
+    @contextmanager
+    def measure(self, key: str):
+        """Yield the timeout for one upstream operation and record its latency.
+
+        A timed-out operation still counts as a sample, with the time it really took
+        (retries included), so the learned p99 can grow again when the upstream slows
+        down.
+        """
+        timeout = self.timeout_for(key)
+        started = time.perf_counter()
+        try:
+            yield timeout
+        except Exception as e:
+            if _is_timeout(e):
+                self._observe(key, time.perf_counter() - started)
+                self._timed_out.add(key)
+            raise
+        self._observe(key, time.perf_counter() - started)
+        self._timed_out.discard(key)
+
+    @contextmanager
+    def call(self, key: str = ""):
+        """Guard and time one upstream call; yields the timeout to use for it."""
+        with self.guard(), self.measure(key) as timeout:
+            yield timeout
+
+    def timeouts(self) -> dict[str, float]:
+        return {key: round(self.timeout_for(key), 3) for key in self._latency}
+
+    def summary(self) -> dict:
+        return {"state": self.state, "failures": self.failures}
+
+    def stats(self) -> dict:
+        return {
+            **self.summary(),
+            "timeouts": self.timeouts(),
+            "cooldown": self.cooldown,
+            "open_for": round(time.time() - self.opened_at, 1) if self.state != "closed" else 0.0,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+        }
+
+
+class SSHChannelsBusy(TimeoutError):
+    """Every channel slot on a pooled transport stayed in use for the whole wait."""
+
+
+def _is_timeout(exc: Exception) -> bool:
+    if isinstance(exc, (TimeoutError, requests.exceptions.Timeout, urllib3.exceptions.TimeoutError)):
+        return True
+    if isinstance(exc, paramiko.SSHException) and "timeout" in str(exc).lower():
+        return True
+    # urllib3 retries wrap read/connect timeouts: ConnectionError(MaxRetryError(reason=ReadTimeoutError))
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(reason, urllib3.exceptions.TimeoutError)
+
+
+def _http_failure(exc: Exception) -> bool:
+    # 4xx means the upstream is up and answered; only transport errors and 5xx count
+    response = getattr(exc, "response", None)
+    if response is not None:
+        return response.status_code >= 500
+    return isinstance(exc, requests.exceptions.RequestException)
+
+
+def _ssh_failure(exc: Exception) -> bool:
+    # PermissionError: sudo rejected the password, so the host itself answered
+    if isinstance(exc, (paramiko.AuthenticationException, SSHChannelsBusy, PermissionError)):
+        return False
+    return isinstance(exc, (OSError, EOFError, paramiko.SSHException))
+
+
+_breakers = {
+    "truenas": CircuitBreaker("TrueNAS", default_timeout=5.0, min_timeout=1.0, is_failure=_http_failure),
+    "netdata": CircuitBreaker("Netdata", default_timeout=2.0, min_timeout=0.5, is_failure=_http_failure),
+    "ssh": CircuitBreaker("SSH", default_timeout=10.0, min_timeout=2.0, is_failure=_ssh_failure),
+}
+
+
+# --- Upstream Capture & Replay ---
+# UPSTREAM_RECORD=<file> logs every TrueNAS/Netdata HTTP exchange and every SSH
+# command's output (smartctl included) with its timing to a gzip JSON-lines file.
+# UPSTREAM_REPLAY=<file> serves those recordings back instead of touching the network,
+# so parsing and the metrics path can be profiled offline against real data.
+# UPSTREAM_REPLAY_SPEED scales time: 1 replays responses as they evolved with their
+# original latency, 10 runs ten times faster, 0 answers immediately and cycles
+# through each request's recordings in order.
+UPSTREAM_RECORD = os.getenv("UPSTREAM_RECORD", "").strip()
+UPSTREAM_REPLAY = os.getenv("UPSTREAM_REPLAY", "").strip()
+UPSTREAM_REPLAY_SPEED = max(0.0, float(os.getenv("UPSTREAM_REPLAY_SPEED", "1").strip() or "1"))
+
+
+def _capture_target(url: str) -> str:
+    parts = urlparse(url)
+    return parts.path + (f"?{parts.query}" if parts.query else "")
+
+
+def _capture_body_key(body) -> str:
+    if not body:
+        return ""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return hashlib.blake2b(body, digest_size=8).hexdigest()
+
+
+def _capture_ssh_key(cmd: str) -> str:
+    # sudo with and without a stdin password runs the same command
+    return cmd.replace("sudo -S -p ''", "sudo", 1)
+
+
+class UpstreamRecorder:
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._raw = None
+        self._file = None
+        self._done = False  # closed, or the file belongs to another process
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._flushed = self._started
+        self.records = 0
+        atexit.register(self.close)
+
+    def _open(self) -> bool:
+        """Take the capture file on the first exchange; False if another process holds it."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Lock before truncating so a second process can't clobber a running capture
+        raw = open(self.path, "ab")
+        if fcntl is not None:
+            try:
+                fcntl.flock(raw.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                raw.close()
+                self._done = True
+                app.logger.warning(f"Not recording upstream exchanges: {self.path} is in use by another process")
+                return False
+        raw.truncate(0)
+        self._raw = raw
+        self._file = io.TextIOWrapper(gzip.GzipFile(fileobj=raw, mode="wb"), encoding="utf-8")
+        self._file.write(json.dumps({"kind": "meta", "version": 1, "started": time.time()}) + "\n")
+        self.records += 1
+        return True
+
+    def _write(self, record: dict) -> None:
+        line = json.dumps(record, separators=(",", ":"), ensure_ascii=False)
+        with self._lock:
+            if self._file is None and (self._done or not self._open()):
+                return
+            self._file.write(line + "\n")
+            self.records += 1
+            now = time.monotonic()
+            if now - self._flushed >= self.FLUSH_INTERVAL:
+                # a sync flush keeps the file readable if the process is killed
+                self._file.flush()
+                self._flushed = now
+
+    def http(self, upstream: str, request, elapsed: float, response=None, error: Exception | None = None) -> None:
+        record = {
+            "kind": "http",
+            "t": round(time.monotonic() - self._started, 4),
+            "upstream": upstream,
+            "method": request.method,
+            "target": _capture_target(request.url),
+            "body": _capture_body_key(request.body),
+            "elapsed": round(elapsed, 4),
+        }
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+        else:
+            record["status"] = response.status_code
+            record["content_type"] = response.headers.get("Content-Type", "")
+            record["content"] = response.content.decode("utf-8", errors="replace")
+        self._write(record)
+
+    def ssh(self, cmd: str, out: str, err: str, elapsed: float) -> None:
+        self._write({
+            "kind": "ssh",
+            "t": round(time.monotonic() - self._started, 4),
+            "cmd": _capture_ssh_key(cmd),
+            "elapsed": round(elapsed, 4),
+            "out": out,
+            "err": err,
+        })
+
+    def close(self) -> None:
+        with self._lock:
+            self._done = True
+            if self._file is not None:
+                self._file.close()  # GzipFile leaves the raw file (and its lock) open
+                self._raw.close()
+                self._file = self._raw = None
+
+    def stats(self) -> dict:
+        return {"mode": "record", "path": str(self.path), "records": self.records}
+
+
+class UpstreamReplay:
+    def __init__(self, path: str, speed: float):
+        self.path = Path(path)
+        self.speed = speed
+        # exact key: (kind, method, target, body); loose key drops the query and body
+        self._exact: dict[tuple, tuple[list[float], list[dict]]] = {}
+        self._loose: dict[tuple, tuple[list[float], list[dict]]] = {}
+        self._cursor: dict[tuple, int] = {}
+        self._lock = threading.Lock()
+        self.duration = 0.0
+        self.records = 0
+        self.served = 0
+        self.misses = 0
+        self._load()
+        self._started = time.monotonic()
+
+    def _load(self) -> None:
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    self._add(json.loads(line))
+        except (EOFError, gzip.BadGzipFile, ValueError) as e:
+            # recordings cut short by a crash end mid-stream; keep what was read
+            app.logger.warning(f"Upstream replay: {self.path.name} is truncated ({e}); using {self.records} records")
+
+    def _add(self, record: dict) -> None:
+        if record.get("kind") == "http":
+            exact = ("http", record["method"], record["target"], record["body"])
+            loose = ("http", record["method"], record["target"].split("?", 1)[0], "")
+        elif record.get("kind") == "ssh":
+            exact = loose = ("ssh", "", record["cmd"], "")
+        else:
+            return
+        for index, key in ((self._exact, exact), (self._loose, loose)):
+            times, entries = index.setdefault(key, ([], []))
+            times.append(record["t"])
+            entries.append(record)
+        self.duration = max(self.duration, record["t"])
+        self.records += 1
+
+    def _pick(self, exact: tuple, loose: tuple) -> dict | None:
+        if exact in self._exact:
+            key, (times, entries) = ("exact", exact), self._exact[exact]
+        elif loose in self._loose:
+            key, (times, entries) = ("loose", loose), self._loose[loose]
+        else:
+            with self._lock:
+                self.misses += 1
+            app.logger.debug(f"Upstream replay: nothing recorded for {exact}")
+            return None
+        if self.speed:
+            # the latest recording at this point of the (looping) replay clock
+            clock = (time.monotonic() - self._started) * self.speed
+            if self.duration:
+                clock %= self.duration + 1
+            record = entries[max(0, bisect.bisect_right(times, clock) - 1)]
+            time.sleep(record["elapsed"] / self.speed)
+        else:
+            with self._lock:
+                cursor = self._cursor.get(key, 0)
+                self._cursor[key] = cursor + 1
+            record = entries[cursor % len(entries)]
+        with self._lock:
+            self.served += 1
+        return record
+
+    def http(self, request) -> requests.Response:
+        target = _capture_target(request.url)
+        record = self._pick(
+            ("http", request.method, target, _capture_body_key(request.body)),
+            ("http", request.method, target.split("?", 1)[0], ""),
+        )
+        if record is not None and "error" in record:
+            raise requests.ConnectionError(f"Replayed: {record['error']}", request=request)
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.encoding = "utf-8"
+        if record is None:
+            response.status_code = 404
+            response.reason = "Not Recorded"
+            response.headers["Content-Type"] = "application/json"
+            response._content = b'{"error": "not in upstream recording"}'
+        else:
+            response.status_code = record["status"]
+            response.reason = "Replayed"
+            response.headers["Content-Type"] = record.get("content_type", "")
+            response._content = record["content"].encode("utf-8")
+        return response
+
+    def ssh(self, cmd: str) -> tuple[str, str]:
+        key = ("ssh", "", _capture_ssh_key(cmd), "")
+        record = self._pick(key, key)
+        if record is None:
+            raise RuntimeError("SSH command not in upstream recording")
+        return record["out"], record["err"]
+
+    def stats(self) -> dict:
+        return {
+            "mode": "replay",
+            "path": str(self.path),
+            "speed": self.speed,
+            "records": self.records,
+            "duration": self.duration,
+            "served": self.served,
+            "misses": self.misses,
+        }
+
+
+class UpstreamCaptureAdapter(HTTPAdapter):
+    """HTTPAdapter that records exchanges to, or answers them from, an upstream log."""
+
+    def __init__(self, upstream: str, **kwargs):
+        self.upstream = upstream
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if _upstream_replay is not None:
+            return _upstream_replay.http(request)
+        started = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except requests.RequestException as e:
+            _upstream_recorder.http(self.upstream, request, time.perf_counter() - started, error=e)
+            raise
+        _upstream_recorder.http(self.upstream, request, time.perf_counter() - started, response)
+        return response
+
+
+_upstream_replay = UpstreamReplay(UPSTREAM_REPLAY, UPSTREAM_REPLAY_SPEED) if UPSTREAM_REPLAY else None
+_upstream_recorder = UpstreamRecorder(UPSTREAM_RECORD) if UPSTREAM_RECORD and not UPSTREAM_REPLAY else None
+_upstream_capture = _upstream_replay or _upstream_recorder
+if _upstream_replay is not None:
+    app.logger.info(f"Replaying {_upstream_replay.records} upstream exchanges from {UPSTREAM_REPLAY}")
+elif _upstream_recorder is not None:
+    app.logger.info(f"Recording upstream exchanges to {UPSTREAM_RECORD}")
+
+
+# --- Upstream HTTP Sessions ---
+# One keep-alive Session per upstream so TCP/TLS connections are reused across
+# calls. Auth headers and the verify flag are resolved once here.
+
+TRUENAS_POOL_SIZE = 10
+NETDATA_POOL_SIZE = 8
+_TRUENAS_VERIFY = TRUENAS_VERIFY_SSL not in {"false", "0", "no"}
+_NETDATA_VERIFY = NETDATA_VERIFY_SSL not in {"false", "0", "no"}
+
+
+def _build_session(name: str, headers: dict[str, str], pool_size: int) -> requests.Session:
+    session = requests.Session()
+    session.headers.update(headers)
+    # Connection errors are retried once for every method (nothing was sent yet),
+    # so an unreachable host costs at most two connect timeouts per call;
+    # 502/503/504 only for idempotent GETs.
+    retry = Retry(
+        total=2,
+        connect=1,
+        read=0,
+        status=1,
+        backoff_factor=0.1,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False,
+    )
+    options = {"pool_connections": 2, "pool_maxsize": pool_size, "max_retries": retry}
+    if _upstream_capture is not None:
+        adapter = UpstreamCaptureAdapter(name, **options)
+    else:
+        adapter = HTTPAdapter(**options)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _build_netdata_headers() -> dict[str, str]:
+    if not NETDATA_BEARER_TOKEN:
+        return {}
+    return {"Authorization": f"Bearer {NETDATA_BEARER_TOKEN}"}
+
+
+_truenas_session = _build_session("truenas", _build_headers(), TRUENAS_POOL_SIZE)
+_netdata_session = _build_session("netdata", _build_netdata_headers(), NETDATA_POOL_SIZE)
+
+
+def _session_pool_stats(session: requests.Session) -> dict[str, int]:
+    """Requests vs. newly opened connections across the session's urllib3 pools."""
+    requests_made = 0
+    new_connections = 0
+    seen = set()
+    for adapter in session.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_made += pool.num_requests
+            new_connections += pool.num_connections
+    return {
+        "requests": requests_made,
+        "new_connections": new_connections,
+        "reused": max(0, requests_made - new_connections),
+    }
+
+
+# --- Single-flight Request Coalescing ---
+# Concurrent callers asking for the same upstream resource wait on one in-flight
+# request and share its result (or its exception), so a burst of N clients
+# costs one upstream call per key instead of N.
+
+class _FlightCall:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _FlightCall()
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            # Leader was cancelled (e.g. killed at its deadline); don't kill the followers too
+            call.error = RuntimeError("Shared upstream call was cancelled")
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> dict[str, int]:
+        return {"executed": self.executed, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+_upstream_flight = SingleFlight()
+
+
+def _flight_key(upstream: str, method: str, path: str, params: dict | None = None) -> tuple:
+    frozen = json.dumps(params, sort_keys=True, default=str) if params else ""
+    return (upstream, method, path, frozen)
+
+
 def _fetch_truenas(path: str, params: dict | None = None) -> dict | list:
     url = f"{_build_base_url()}{path}"
-    verify_ssl = TRUENAS_VERIFY_SSL not in {"false", "0", "no"}
+
+    def _get():
+        with _breakers["truenas"].call(path) as timeout, _upstream_seconds.time("truenas", path):
+            response = _truenas_session.get(
+                url,
+                params=params,
+                timeout=timeout,
+                verify=_TRUENAS_VERIFY,
+            )
+            response.raise_for_status()
+            return response.json()
+
     try:
-        response = requests.get(
-            url,
-            headers=_build_headers(),
-            params=params,
-            timeout=5, # Increased timeout for responsiveness
-            verify=verify_ssl,
-        )
-        response.raise_for_status()
-        return response.json()
+        return _upstream_flight.do(_flight_key("truenas", "GET", path, params), _get)
+    except CircuitOpenError:
+        raise  # logged once when the breaker opened
     except requests.exceptions.RequestException as e:
         app.logger.warning(f"TrueNAS Fetch Error [{path}]: {e}")
         raise
 
 def _post_truenas(path: str, json_data: dict | None = None) -> dict | list:
     url = f"{_build_base_url()}{path}"
-    verify_ssl = TRUENAS_VERIFY_SSL not in {"false", "0", "no"}
+
+    def _post():
+        with _breakers["truenas"].call(path) as timeout, _upstream_seconds.time("truenas", path):
+            response = _truenas_session.post(
+                url,
+                json=json_data,
+                timeout=timeout,
+                verify=_TRUENAS_VERIFY,
+            )
+            response.raise_for_status()
+            return response.json()
+
     try:
-        response = requests.post(
-            url,
-            headers=_build_headers(),
-            json=json_data,
-            timeout=5, # Increased timeout
-            verify=verify_ssl,
-        )
-        response.raise_for_status()
-        return response.json()
+        return _upstream_flight.do(_flight_key("truenas", "POST", path, json_data), _post)
+    except CircuitOpenError:
+        raise  # logged once when the breaker opened
     except requests.exceptions.RequestException as e:
         app.logger.warning(f"TrueNAS Post Error [{path}]: {e}")
         raise
 
 
-_truenas_cache_store = {}
+# --- TrueNAS Response Cache ---
+# Bounded LRU cache (entry count + estimated bytes) with a TTL per path.
+# Expired entries are served stale for up to one more TTL while a single
+# background refresh runs, so a user request never waits on TrueNAS for a
+# key that was cached before.
 
-def _fetch_truenas_cached(path: str, params: dict | None = None, cache_duration: int = 60) -> dict | list:
-    key_params = frozenset(params.items()) if params else None
-    key = (path, key_params)
-    now = time.time()
-    
-    if key in _truenas_cache_store:
-        timestamp, data = _truenas_cache_store[key]
-        if now - timestamp < cache_duration:
-            return data
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_BYTES = 8 * 1024 * 1024
+CACHE_TTLS = {
+    "/api/v2.0/system/info": 3600,
+    "/api/v2.0/pool": CACHE_DURATION_POOLS,
+    "/api/v2.0/pool/dataset": CACHE_DURATION_DATASETS,
+    "/api/v2.0/disk": CACHE_DURATION_DISKS,
+    "/api/v2.0/smart/test/results": CACHE_DURATION_DISKS,
+}
+CACHE_DEFAULT_TTL = 60
+
+
+def _estimate_size(data) -> int:
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    try:
+        return len(json.dumps(data, separators=(",", ":"), default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class TTLCache:
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()  # key -> (stored_at, ttl, size, data)
+        self._bytes = 0
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.refresh_errors = 0
+
+    def get(self, key, loader, ttl: float):
+        """Return the cached value for `key`, calling `loader()` on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, _, _, data = entry
+                age = now - stored_at
+                if age < ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return data
+                if age < ttl * 2:
+                    self._entries.move_to_end(key)
+                    self.stale += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        socketio.start_background_task(self._refresh, key, loader, ttl)
+                    return data
+            self.misses += 1
+
+        data = loader()
+        self.put(key, data, ttl)
+        return data
+
+    def peek(self, key, max_age: float):
+        """Return the cached value if it is younger than max_age, without loading."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] >= max_age:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+
+    def age(self, key) -> float | None:
+        with self._lock:
+            entry = self._entries.get(key)
+        return None if entry is None else time.time() - entry[0]
+
+    def put(self, key, data, ttl: float) -> None:
+        size = _estimate_size(data)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (time.time(), ttl, size, data)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+                self.evictions += 1
+
+    def invalidate(self, match) -> int:
+        """Drop every entry whose key satisfies `match(key)`; returns how many were dropped."""
+        with self._lock:
+            doomed = [k for k in self._entries if match(k)]
+            for k in doomed:
+                self._bytes -= self._entries.pop(k)[2]
+        return len(doomed)
+
+    def _refresh(self, key, loader, ttl: float) -> None:
+        try:
+            self.put(key, loader(), ttl)
+        except Exception as e:
+            self.refresh_errors += 1
+            app.logger.warning(f"Background cache refresh failed [{key[0]}]: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "refreshing": len(self._refreshing),
+                "refresh_errors": self.refresh_errors,
+            }
 
-    data = _fetch_truenas(path, params)
-    _truenas_cache_store[key] = (now, data)
-    
-    if len(_truenas_cache_store) > 100:
-        _truenas_cache_store.clear()
-        _truenas_cache_store[key] = (now, data)
-        
-    return data
+
+_truenas_cache_store = TTLCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES)
+
+
+def _fetch_truenas_cached(path: str, params: dict | None = None, cache_duration: int | None = None) -> dict | list:
+    key_params = frozenset(params.items()) if params else None
+    ttl = cache_duration or CACHE_TTLS.get(path, CACHE_DEFAULT_TTL)
+    return _truenas_cache_store.get((path, key_params), lambda: _fetch_truenas(path, params), ttl)
 
 
 def _build_netdata_base_url() -> str:
@@ -219,24 +1108,25 @@ def _fetch_netdata(path: str, params: dict | None = None) -> dict | None:
     base_url = _build_netdata_base_url()
     if not base_url:
         return None
-    verify_ssl = NETDATA_VERIFY_SSL not in {"false", "0", "no"}
-    headers = {}
-    if NETDATA_BEARER_TOKEN:
-        headers["Authorization"] = f"Bearer {NETDATA_BEARER_TOKEN}"
-    
+
+    def _get():
+        with _breakers["netdata"].call(path) as timeout, _upstream_seconds.time("netdata", path):
+            response = _netdata_session.get(
+                f"{base_url}{path}",
+                params=params,
+                timeout=timeout,
+                verify=_NETDATA_VERIFY,
+            )
+            if response.status_code >= 500:
+                response.raise_for_status()
+            if not response.ok:
+                # Don't raise, just log and return None to allow partial dashboard loading
+                app.logger.debug(f"Netdata request failed: {response.status_code}")
+                return None
+            return response.json()
+
     try:
-        response = requests.get(
-            f"{base_url}{path}",
-            params=params,
-            timeout=2, # Increased timeout for Netdata
-            verify=verify_ssl,
-            headers=headers,
-        )
-        if not response.ok:
-            # Don't raise, just log and return None to allow partial dashboard loading
-            app.logger.debug(f"Netdata request failed: {response.status_code}")
-            return None
-        return response.json()
+        return _upstream_flight.do(_flight_key("netdata", "GET", path, params), _get)
     except requests.exceptions.RequestException as e:
         app.logger.debug(f"Netdata Connection Error: {e}")
         return None
@@ -293,6 +1183,52 @@ def _netdata_latest(chart: str) -> dict[str, float] | None:
     return values
 
 
+# Latest value of every dashboard chart in one request. /api/v1/allmetrics returns
+# {chart_id: {"dimensions": {dim_id: {"name": ..., "value": ...}}}}, which maps
+# onto the same {dimension name: value} dicts _netdata_latest produces. When it fails
+# while per-chart queries work, the batch path is skipped until the retry time, so a
+# Netdata restart or one bad reply does not disable it for good.
+NETDATA_BATCH_RETRY_INTERVAL = 300
+_netdata_batch_retry_at = 0.0
+
+
+def _netdata_latest_many(charts: list[str]) -> dict[str, dict[str, float] | None] | None:
+    """Latest values for several charts in one call; None if the batch endpoint failed."""
+    wanted = [c for c in dict.fromkeys(charts) if c]
+    if not wanted:
+        return {}
+    if time.time() < _netdata_batch_retry_at:
+        return None
+    payload = _fetch_netdata(
+        "/api/v1/allmetrics",
+        params={"format": "json", "filter": " ".join(wanted)},
+    )
+    if not isinstance(payload, dict):
+        return None
+
+    result: dict[str, dict[str, float] | None] = {}
+    for chart in wanted:
+        entry = payload.get(chart) or {}
+        values: dict[str, float] = {}
+        for dim_id, dim in (entry.get("dimensions") or {}).items():
+            try:
+                values[dim.get("name") or dim_id] = float(dim.get("value"))
+            except (AttributeError, TypeError, ValueError):
+                continue
+        result[chart] = values or None
+    return result
+
+
+def _note_netdata_batch_unsupported(per_chart: dict) -> None:
+    """Pause allmetrics for a while when per-chart queries work while it does not."""
+    global _netdata_batch_retry_at
+    if time.time() >= _netdata_batch_retry_at and any(v is not None for v in per_chart.values()):
+        _netdata_batch_retry_at = time.time() + NETDATA_BATCH_RETRY_INTERVAL
+        app.logger.info(
+            f"Netdata /api/v1/allmetrics unavailable; using one /data query per chart for {NETDATA_BATCH_RETRY_INTERVAL}s"
+        )
+
+
 def _calc_cpu_usage(latest: dict[str, float] | None) -> float | None:
     if not latest:
         return None
@@ -303,32 +1239,202 @@ def _calc_cpu_usage(latest: dict[str, float] | None) -> float | None:
     return None
 
 
-def _get_gpu_stats() -> dict | None:
+# --- GPU Sampler ---
+# One long-lived sampler feeds a shared snapshot instead of forking nvidia-smi per tick.
+# NVML (pynvml) is used when importable; otherwise nvidia-smi runs in --loop-ms mode and
+# its CSV output is read line by line. Point NVIDIA_SMI_BIN at tools/fake_nvidia_smi.py
+# to exercise the sampler on machines without a GPU.
+try:
+    import pynvml
+except ImportError:  # Optional dependency
+    pynvml = None
+
+NVIDIA_SMI_BIN = os.getenv("NVIDIA_SMI_BIN", "").strip()
+GPU_SAMPLE_MS = max(250, int(os.getenv("GPU_SAMPLE_MS", "2000").strip() or "2000"))
+GPU_RESTART_DELAY = 60
+
+# Free-text fields go last so a comma inside them cannot shift the columns
+_SMI_GPU_QUERY = "index,uuid,utilization.gpu,temperature.gpu,memory.used,memory.total,name"
+_SMI_APPS_QUERY = "timestamp,gpu_uuid,pid,used_memory,process_name"
+_MIB = 1024 * 1024
+
+
+def _smi_number(text: str) -> float | None:
+    # nvidia-smi reports unsupported fields as "[N/A]" / "[Not Supported]"
     try:
-        import subprocess
-        # Get utilization.gpu, temperature.gpu, memory.used, memory.total
-        cmd = ['nvidia-smi', '--query-gpu=utilization.gpu,temperature.gpu,memory.used,memory.total', '--format=csv,noheader,nounits']
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=1)
-        
-        if result.returncode != 0:
-            return None
-            
-        line = result.stdout.strip()
-        if not line:
-            return None
-            
-        parts = [x.strip() for x in line.split(',')]
-        if len(parts) < 4:
+        return float(text.strip())
+    except ValueError:
+        return None
+
+
+class GPUSampler:
+    def __init__(self, interval_ms: int, smi_bin: str):
+        self.interval = interval_ms / 1000.0
+        self.smi_bin = smi_bin
+        self.backend: str | None = None
+        self._gpus: dict[int, dict] = {}
+        self._uuid_index: dict[str, int] = {}
+        self._updated_at = 0.0
+        self._processes: list[dict] = []
+        self._processes_at = 0.0
+        self._apps_round: str | None = None
+        self._apps_pending: list[dict] = []
+        self._started = False
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        # An explicit NVIDIA_SMI_BIN wins so the fake binary can be used on GPU hosts too
+        if pynvml is not None and not self.smi_bin:
+            try:
+                pynvml.nvmlInit()
+                self.backend = "nvml"
+                socketio.start_background_task(target=self._run_nvml)
+                app.logger.info(f"GPU sampler started (nvml, every {GPU_SAMPLE_MS}ms)")
+                return
+            except Exception as exc:
+                app.logger.info(f"NVML unavailable ({exc}); falling back to nvidia-smi")
+        self.backend = "nvidia-smi"
+        socketio.start_background_task(self._run_smi, "--query-gpu", _SMI_GPU_QUERY, self._on_gpu_line)
+        socketio.start_background_task(self._run_smi, "--query-compute-apps", _SMI_APPS_QUERY, self._on_app_line)
+        app.logger.info(f"GPU sampler started ({self.smi_bin or 'nvidia-smi'} --loop-ms={GPU_SAMPLE_MS})")
+
+    # -- NVML backend --
+    def _run_nvml(self) -> None:
+        while True:
+            try:
+                self._sample_nvml()
+            except Exception as exc:
+                app.logger.warning(f"NVML sample failed: {exc}")
+            socketio.sleep(self.interval)
+
+    def _sample_nvml(self) -> None:
+        gpus: dict[int, dict] = {}
+        processes: list[dict] = []
+        for i in range(pynvml.nvmlDeviceGetCount()):
+            handle = pynvml.nvmlDeviceGetHandleByIndex(i)
+            mem = pynvml.nvmlDeviceGetMemoryInfo(handle)
+            name = pynvml.nvmlDeviceGetName(handle)
+            uuid = pynvml.nvmlDeviceGetUUID(handle)
+            gpus[i] = {
+                "index": i,
+                "uuid": uuid.decode() if isinstance(uuid, bytes) else uuid,
+                "name": name.decode() if isinstance(name, bytes) else name,
+                "utilization": float(pynvml.nvmlDeviceGetUtilizationRates(handle).gpu),
+                "temperature": float(pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)),
+                "memory_used": mem.used / _MIB,
+                "memory_total": mem.total / _MIB,
+            }
+            for proc in pynvml.nvmlDeviceGetComputeRunningProcesses(handle):
+                try:
+                    pname = pynvml.nvmlSystemGetProcessName(proc.pid)
+                    pname = pname.decode() if isinstance(pname, bytes) else pname
+                except Exception:
+                    pname = None
+                used = proc.usedGpuMemory
+                processes.append({
+                    "gpu_index": i,
+                    "pid": proc.pid,
+                    "name": pname,
+                    "memory_used": used / _MIB if used else None,
+                })
+        now = time.time()
+        self._gpus = gpus
+        self._updated_at = now
+        self._processes = processes
+        self._processes_at = now
+
+    # -- nvidia-smi backend --
+    def _run_smi(self, flag: str, query: str, on_line) -> None:
+        cmd = [
+            self.smi_bin or "nvidia-smi", f"{flag}={query}",
+            "--format=csv,noheader,nounits", f"--loop-ms={GPU_SAMPLE_MS}",
+        ]
+        while True:
+            try:
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            except OSError as exc:
+                app.logger.info(f"GPU sampler: cannot run {cmd[0]} ({exc}); retrying in {GPU_RESTART_DELAY}s")
+                socketio.sleep(GPU_RESTART_DELAY)
+                continue
+            try:
+                for line in proc.stdout:
+                    if line.strip():
+                        try:
+                            on_line(line)
+                        except (IndexError, ValueError):
+                            app.logger.debug(f"GPU sampler: unparsable line {line!r}")
+            finally:
+                proc.kill()
+                proc.wait()
+            app.logger.info(f"GPU sampler: {cmd[0]} {flag} exited ({proc.returncode}); restarting in {GPU_RESTART_DELAY}s")
+            socketio.sleep(GPU_RESTART_DELAY)
+
+    def _on_gpu_line(self, line: str) -> None:
+        index, uuid, util, temp, used, total, name = [p.strip() for p in line.split(",", 6)]
+        gpu = {
+            "index": int(index),
+            "uuid": uuid,
+            "name": name,
+            "utilization": _smi_number(util),
+            "temperature": _smi_number(temp),
+            "memory_used": _smi_number(used),
+            "memory_total": _smi_number(total),
+        }
+        # Copy-on-write so readers never see a dict being mutated
+        self._gpus = {**self._gpus, gpu["index"]: gpu}
+        self._uuid_index = {**self._uuid_index, uuid: gpu["index"]}
+        self._updated_at = time.time()
+
+    def _on_app_line(self, line: str) -> None:
+        # Each --loop round lists every process with the same timestamp; no line at all
+        # means no processes, which the staleness check in snapshot() takes care of.
+        stamp, uuid, pid, used, name = [p.strip() for p in line.split(",", 4)]
+        if stamp != self._apps_round:
+            self._apps_round = stamp
+            self._apps_pending = []
+        self._apps_pending.append({
+            "gpu_index": self._uuid_index.get(uuid),
+            "pid": int(pid),
+            "name": name,
+            "memory_used": _smi_number(used),
+        })
+        self._processes = list(self._apps_pending)
+        self._processes_at = time.time()
+
+    def snapshot(self) -> dict | None:
+        now = time.time()
+        stale_after = max(5.0, 3 * self.interval)
+        if not self._gpus or now - self._updated_at > stale_after:
             return None
-            
+        gpus = [self._gpus[i] for i in sorted(self._gpus)]
+        processes = self._processes if now - self._processes_at <= stale_after else []
+        first = gpus[0]
+        # Top-level fields mirror the first GPU so existing dashboard code keeps working
         return {
-            "utilization": float(parts[0]),
-            "temperature": float(parts[1]),
-            "memory_used": float(parts[2]),
-            "memory_total": float(parts[3])
+            "utilization": first["utilization"],
+            "temperature": first["temperature"],
+            "memory_used": first["memory_used"],
+            "memory_total": first["memory_total"],
+            "gpus": gpus,
+            "processes": processes,
         }
-    except Exception:
-        return None
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "gpus": len(self._gpus),
+            "age": round(time.time() - self._updated_at, 3) if self._updated_at else None,
+            "processes": len(self._processes),
+        }
+
+
+_gpu_sampler = GPUSampler(GPU_SAMPLE_MS, NVIDIA_SMI_BIN)
+
+
+def _get_gpu_stats() -> dict | None:
+    return _gpu_sampler.snapshot()
 
 
 def _calc_memory(latest: dict[str, float] | None) -> dict[str, float] | None:
@@ -416,27 +1522,53 @@ def _calc_net_io(
     return {"label": label, "rx": rx, "tx": tx}
 
 
-def _get_truenas_dataset_usage(mountpoint: str, label: str) -> dict | None:
-    try:
-        datasets = _fetch_truenas_cached("/api/v2.0/pool/dataset", params={"mountpoint": mountpoint}, cache_duration=CACHE_DURATION_DATASETS)
-    except Exception as e:
-        app.logger.error(f"Failed to fetch dataset for {mountpoint}: {e}")
-        return None
-
-    if not datasets or not isinstance(datasets, list):
-        return None
-
-    ds = next((d for d in datasets if d.get("mountpoint") == mountpoint), None)
-    if not ds:
-        return None
+def _dataset_index_load() -> dict:
+    # One unfiltered query, projected down to the fields the panels need
+    datasets = _fetch_truenas("/api/v2.0/pool/dataset", params={"limit": 0})
+    if not isinstance(datasets, list):
+        raise ValueError("Unexpected pool/dataset response")
 
     def _extract_val(field):
         if isinstance(field, dict):
             return field.get("parsed") or field.get("value")
         return field
 
-    used = _extract_val(ds.get("used"))
-    avail = _extract_val(ds.get("available"))
+    by_mountpoint: dict[str, dict] = {}
+    by_name: dict[str, dict] = {}
+    for ds in datasets:
+        entry = {
+            "name": ds.get("name") or ds.get("id"),
+            "mountpoint": ds.get("mountpoint"),
+            "used": _extract_val(ds.get("used")),
+            "available": _extract_val(ds.get("available")),
+        }
+        if entry["name"]:
+            by_name[entry["name"]] = entry
+        if entry["mountpoint"]:
+            by_mountpoint[entry["mountpoint"]] = entry
+    return {"by_mountpoint": by_mountpoint, "by_name": by_name}
+
+
+def _dataset_index() -> dict:
+    return _truenas_cache_store.get(
+        ("dataset-index",), _dataset_index_load, CACHE_TTLS["/api/v2.0/pool/dataset"]
+    )
+
+
+def _get_truenas_dataset_usage(key: str, label: str, index: dict | None = None) -> dict | None:
+    if index is None:
+        try:
+            index = _dataset_index()
+        except Exception as e:
+            app.logger.error(f"Failed to fetch datasets: {e}")
+            return None
+
+    ds = (index["by_mountpoint"] if key.startswith("/") else index["by_name"]).get(key)
+    if not ds:
+        return None
+
+    used = ds["used"]
+    avail = ds["available"]
 
     if used is None or avail is None:
         return None
@@ -451,6 +1583,7 @@ def _get_truenas_dataset_usage(mountpoint: str, label: str) -> dict | None:
         
         return {
             "label": label,
+            "dataset": ds["name"],
             "used": used_bytes / gib_divisor,
             "total": total_bytes / gib_divisor,
             "used_percent": used_percent
@@ -459,10 +1592,25 @@ def _get_truenas_dataset_usage(mountpoint: str, label: str) -> dict | None:
         return None
 
 
-def _get_disk_info() -> list[dict] | None:
+def _get_dashboard_datasets() -> list[dict]:
+    """Usage for every configured panel, all served from a single dataset query."""
+    try:
+        index = _dataset_index()
+    except Exception as e:
+        app.logger.error(f"Failed to fetch datasets: {e}")
+        return []
+    panels = []
+    for key, label in DASHBOARD_DATASETS:
+        usage = _get_truenas_dataset_usage(key, label, index)
+        if usage:
+            panels.append(usage)
+    return panels
+
+
+def _get_disk_info(temp_fallback: bool = True) -> list[dict] | None:
     try:
         try:
-            disks = _fetch_truenas_cached("/api/v2.0/disk", params={"limit": 0}, cache_duration=CACHE_DURATION_DISKS)
+            disks = _fetch_truenas_cached("/api/v2.0/disk", params={"limit": 0})
         except requests.exceptions.HTTPError as e:
             app.logger.warning(f"Failed to fetch /disk: {e}")
             return None
@@ -510,45 +1658,52 @@ def _get_disk_info() -> list[dict] | None:
             "description": description
         })
 
-    # --- Fallback: for disks with no temperature (e.g. SATA-over-USB bridges),
-    #     try smartctl with SAT passthrough via SSH. ---
-    missing_temp = [d for d in result if d["temp"] is None]
-    if missing_temp and (os.getenv("SSH_PRIVATE_KEY_B64") or os.getenv("SSH_PASSWORD")):
-        import json as _json
+    if temp_fallback:
+        _fill_missing_disk_temps(result)
+    return result
 
-        def _fetch_temp_sat(disk: dict) -> int | None:
-            dev = f"/dev/{disk['name']}"
-            for dtype in ("sat", "sat,auto"):
-                try:
-                    out, _ = _ssh_exec(f"sudo smartctl -d {dtype} --json -A {dev}", timeout=15)
-                    if not out.strip():
-                        continue
-                    sj = _json.loads(out)
-                    t = (sj.get("temperature") or {}).get("current")
-                    if t is not None:
-                        app.logger.info(f"Temp fallback via -d {dtype} for {dev}: {t}°C")
-                        return t
-                except Exception as e:
-                    app.logger.debug(f"Temp fallback failed for {dev} (dtype={dtype}): {e}")
-            return None
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as ex:
-            futures = {ex.submit(_fetch_temp_sat, d): d for d in missing_temp}
-            for fut, disk in futures.items():
-                try:
-                    t = fut.result(timeout=20)
-                    if t is not None:
-                        disk["temp"] = t
-                except Exception:
-                    pass
+def _fill_missing_disk_temps(disks: list[dict]) -> None:
+    """Fill in temperatures TrueNAS did not report, in place.
 
-    return result
+    Disks without one (e.g. SATA-over-USB bridges) first get the last SMART-cache
+    reading; only those still missing one are read with smartctl and SAT
+    passthrough via SSH. The dicts are updated as readings arrive, so a caller that
+    gives up early still keeps whatever was filled in so far.
+    """
+    for disk in disks:
+        if disk["temp"] is None and disk["serial"]:
+            cached = _smart_cache.peek(disk["serial"], SMART_CACHE_TTL)
+            if cached and cached.get("temp") is not None:
+                disk["temp"] = cached["temp"]
+    missing_temp = [d for d in disks if d["temp"] is None]
+    if not missing_temp:
+        return
+    if os.getenv("SSH_PRIVATE_KEY_B64") or os.getenv("SSH_PASSWORD"):
+        by_name = {d["name"]: d for d in missing_temp}
+        try:
+            # One SSH exec for every disk that needs the fallback
+            for name, dtype, sj in _smartctl_batch(
+                [(name, _smartctl_dtype_candidates(d["serial"], ("sat", "sat,auto"))) for name, d in by_name.items()],
+                smart_args="-A",
+                timeout=DISK_TEMP_FALLBACK_TIMEOUT,
+            ):
+                if not sj or name not in by_name:
+                    continue
+                if _smart_json_useful(sj):
+                    _remember_smartctl_dtype(by_name[name]["serial"], dtype)
+                t = _parse_smartctl_json(sj, name).get("temp")
+                if t is not None:
+                    app.logger.debug(f"Temp fallback via -d {dtype} for /dev/{name}: {t}°C")
+                    by_name[name]["temp"] = t
+        except Exception as e:
+            app.logger.debug(f"Temp fallback failed: {e}")
 
 
 def _get_system_info_truenas() -> dict:
-    # Cache for a long time (e.g. 1 hour) as hardware doesn't change often
+    # Cached for a long time (see CACHE_TTLS) as hardware doesn't change often
     try:
-        info = _fetch_truenas_cached("/api/v2.0/system/info", cache_duration=3600)
+        info = _fetch_truenas_cached("/api/v2.0/system/info")
     except Exception as e:
         app.logger.warning(f"Failed to fetch system info: {e}")
         return {}
@@ -606,132 +1761,846 @@ def index() -> str:
     )
 
 
-@app.route("/api/metrics")
-def api_metrics():
-    try:
-        # Defaults
-        gpu_stats = None
-        cpu_usage = 0.0
-        memory = None
-        cpu_temp = None
-        disks = []
-        nets = []
-        
-        # Use a timeout for futures to prevent blocking indefinitely
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            f_cpu = executor.submit(_netdata_latest, NETDATA_CHART_CPU)
-            f_ram = executor.submit(_netdata_latest, NETDATA_CHART_RAM)
-            f_temp = executor.submit(_netdata_latest, NETDATA_CHART_CPU_TEMP)
-            
-            f_n1_chart = executor.submit(_netdata_latest, NETDATA_CHART_NET1) if NETDATA_CHART_NET1 else None
-            f_n1_iface = executor.submit(_netdata_latest, f"net.{TRUENAS_INTERFACE_NET1}") if TRUENAS_INTERFACE_NET1 else None
-            
-            f_n2_chart = executor.submit(_netdata_latest, NETDATA_CHART_NET2) if NETDATA_CHART_NET2 else None
-            f_n2_iface = executor.submit(_netdata_latest, f"net.{TRUENAS_INTERFACE_NET2}") if TRUENAS_INTERFACE_NET2 else None
+# --- Fan-out Engine ---
+# One process-wide, bounded eventlet GreenPool for the upstream calls the
+# endpoints and the collector make in parallel. Each task carries a deadline
+# counted from submission; a task still running at its deadline is killed so it
+# cannot keep a connection or pool slot busy.
 
-            f_store_1 = executor.submit(_get_truenas_dataset_usage, "/mnt/storage", "storage (/mnt/storage)")
-            f_store_2 = executor.submit(_get_truenas_dataset_usage, "/mnt/Apps", "Apps (/mnt/Apps)")
+FANOUT_POOL_SIZE = 64
+STATS_TASK_TIMEOUT = 8
+# The smartctl temperature fallback gets its own, longer budget; past it /api/stats
+# answers with whatever temperatures were filled in instead of failing.
+DISK_TEMP_FALLBACK_TIMEOUT = 30
+STATS_DISK_TEMP_TIMEOUT = DISK_TEMP_FALLBACK_TIMEOUT + 5
 
-            # Safe result retrieval with default None
-            def get_res(f):
-                try:
-                    return f.result(timeout=6) if f else None
-                except Exception as e:
-                    app.logger.warning(f"Future timed out or failed: {e}")
-                    return None
 
-            cpu_latest = get_res(f_cpu)
-            ram_latest = get_res(f_ram)
-            temp_latest = get_res(f_temp)
-            
-            net1_chart_res = get_res(f_n1_chart)
-            net1_iface_res = get_res(f_n1_iface)
-            
-            net2_chart_res = get_res(f_n2_chart)
-            net2_iface_res = get_res(f_n2_iface)
-            
-            storage_disk = get_res(f_store_1)
-            apps_disk = get_res(f_store_2)
+class FanOutTask:
+    def __init__(self, engine: "FanOut", name: str, timeout: float):
+        self.engine = engine
+        self.name = name
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+        self.greenthread = None
 
+    def result(self):
+        """Wait until the task's deadline; raises TimeoutError (after cancelling) if it runs over."""
+        timer = eventlet.Timeout(max(0.0, self.deadline - time.monotonic()))
+        try:
+            return self.greenthread.wait()
+        except eventlet.Timeout as t:
+            if t is not timer:
+                raise
+            self.cancel()
+            self.engine.timeouts += 1
+            raise TimeoutError(f"{self.name} exceeded its {self.timeout}s deadline")
+        finally:
+            timer.cancel()
+
+    def cancel(self) -> None:
+        if self.greenthread is not None and not self.greenthread.dead:
+            self.greenthread.kill()
+            self.engine.cancelled += 1
+
+
+class FanOut:
+    def __init__(self, size: int):
+        self.size = size
+        self._pool = eventlet.GreenPool(size)
+        self.submitted = 0
+        self.saturated = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.errors = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    def submit(self, fn, *args, timeout: float, **kwargs) -> FanOutTask:
+        task = FanOutTask(self, getattr(fn, "__name__", "task"), timeout)
+        queued_at = time.monotonic()
+        self.submitted += 1
+        if self._pool.free() == 0:
+            self.saturated += 1
+
+        def _run():
+            waited = time.monotonic() - queued_at
+            self.queue_wait_total += waited
+            self.queue_wait_max = max(self.queue_wait_max, waited)
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                self.errors += 1
+                raise
 
-        # Run GPU check in main thread or pool (fast enough)
-        gpu_stats = _get_gpu_stats()
+        # GreenPool.spawn blocks while the pool is full; that time counts as queue wait
+        task.greenthread = self._pool.spawn(_run)
+        return task
 
-        cpu_temp = _calc_cpu_temp(temp_latest)
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "running": self._pool.running(),
+            "waiting": self._pool.waiting(),
+            "submitted": self.submitted,
+            "saturated": self.saturated,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "errors": self.errors,
+            "queue_wait_avg_ms": round(self.queue_wait_total / self.submitted * 1000, 3) if self.submitted else 0.0,
+            "queue_wait_max_ms": round(self.queue_wait_max * 1000, 3),
+        }
 
-        net1_latest = None
-        if net1_chart_res:
-             net1_latest = _calc_net_io(net1_chart_res, NETDATA_LABEL_NET1)
-        
-        if not net1_latest and TRUENAS_INTERFACE_NET1:
-             if net1_iface_res: 
-                 net1_latest = _calc_net_io(net1_iface_res, NETDATA_LABEL_NET1)
-             else:
-                 net1_truenas = _get_truenas_net_stats(TRUENAS_INTERFACE_NET1)
-                 if net1_truenas:
-                    net1_latest = {"label": NETDATA_LABEL_NET1, "rx": net1_truenas["rx"], "tx": net1_truenas["tx"]}
-
-        net2_latest = None
-        if net2_chart_res:
-             net2_latest = _calc_net_io(net2_chart_res, NETDATA_LABEL_NET2)
-
-        if not net2_latest and TRUENAS_INTERFACE_NET2:
-             if net2_iface_res:
-                 net2_latest = _calc_net_io(net2_iface_res, NETDATA_LABEL_NET2)
-             else:
-                 net2_truenas = _get_truenas_net_stats(TRUENAS_INTERFACE_NET2)
-                 if net2_truenas:
-                    net2_latest = {"label": NETDATA_LABEL_NET2, "rx": net2_truenas["rx"], "tx": net2_truenas["tx"]}
-
-        cpu_usage = _calc_cpu_usage(cpu_latest)
-        memory = _calc_memory(ram_latest)
-
-        disks = []
-        if storage_disk: disks.append(storage_disk)
-        if apps_disk: disks.append(apps_disk)
-
-        nets = []
-        if net1_latest:
-            nets.append({"label": net1_latest["label"], "rx": net1_latest["rx"], "tx": net1_latest["tx"]})
-        if net2_latest:
-            nets.append({"label": net2_latest["label"], "rx": net2_latest["rx"], "tx": net2_latest["tx"]})
-
-        return jsonify(
-            {
-                "gpu": gpu_stats,
-                "system_ip": TRUENAS_DISPLAY_IP,
-                "cpu_usage": cpu_usage,
-                "cpu_temp": cpu_temp,
-                "memory": memory,
-                "disks": disks,
-                "nets": nets,
-            }
-        )
-    except Exception as exc:  # Catch all to ensure JSON return
-        app.logger.error(f"Metrics Error: {exc}")
-        # Return partial/empty structure to prevent frontend hanging
-        return jsonify({
-            "gpu": None,
-            "system_ip": TRUENAS_DISPLAY_IP,
-            "cpu_usage": 0,
-            "cpu_temp": None,
-            "memory": None,
-            "disks": [],
-            "nets": [],
-            "error": str(exc)
-        })
 
+_fanout = FanOut(FANOUT_POOL_SIZE)
 
 
-@app.route("/api/netdata/charts")
-def api_netdata_charts():
-    try:
-        data = _fetch_netdata("/api/v1/charts")
-        return jsonify(data or {})
-    except requests.exceptions.RequestException as exc:
-        return (
-            jsonify(_format_request_error("Failed to reach Netdata", exc)),
-            502,
+# --- Background Metrics Collector ---
+# A single green thread samples Netdata / TrueNAS / nvidia-smi every
+# METRICS_INTERVAL seconds and publishes the result as a snapshot.
+# /api/metrics only serializes the latest snapshot, so upstream load does not
+# grow with the number of connected browsers.
+
+class MetricsSnapshot(NamedTuple):
+    seq: int
+    timestamp: float
+    data: dict
+
+
+_metrics_snapshot: MetricsSnapshot | None = None
+_metrics_ready = threading.Event()
+_metrics_collector_started = False
+
+
+def _empty_metrics(error: str | None = None) -> dict:
+    data = {
+        "gpu": None,
+        "system_ip": TRUENAS_DISPLAY_IP,
+        "cpu_usage": 0,
+        "cpu_temp": None,
+        "memory": None,
+        "disks": [],
+        "nets": [],
+        "disk_io": None,
+        "upstreams": {name: breaker.summary() for name, breaker in _breakers.items()},
+    }
+    if error:
+        data["error"] = error
+    return data
+
+
+def _collect_metrics() -> dict:
+    # Defaults
+    gpu_stats = None
+    cpu_usage = 0.0
+    memory = None
+    cpu_temp = None
+    disks = []
+    nets = []
+    
+    net1_iface_chart = f"net.{TRUENAS_INTERFACE_NET1}" if TRUENAS_INTERFACE_NET1 else ""
+    net2_iface_chart = f"net.{TRUENAS_INTERFACE_NET2}" if TRUENAS_INTERFACE_NET2 else ""
+    charts = [
+        NETDATA_CHART_CPU, NETDATA_CHART_RAM, NETDATA_CHART_CPU_TEMP,
+        NETDATA_CHART_NET1, net1_iface_chart, NETDATA_CHART_NET2, net2_iface_chart,
+    ]
+
+    # Every task gets a deadline so one slow upstream cannot hold the tick
+    t_netdata = _fanout.submit(_netdata_latest_many, charts, timeout=6)
+    t_datasets = _fanout.submit(_get_dashboard_datasets, timeout=6)
+
+    # Safe result retrieval with default None
+    def get_res(t):
+        try:
+            return t.result() if t else None
+        except Exception as e:
+            app.logger.warning(f"Task timed out or failed: {e}")
+            return None
+
+    latest = get_res(t_netdata)
+    if latest is None:
+        # Batched endpoint unavailable: one request per chart
+        per_chart = {c: _fanout.submit(_netdata_latest, c, timeout=6) for c in dict.fromkeys(charts) if c}
+        latest = {c: get_res(t) for c, t in per_chart.items()}
+        _note_netdata_batch_unsupported(latest)
+
+    cpu_latest = latest.get(NETDATA_CHART_CPU)
+    ram_latest = latest.get(NETDATA_CHART_RAM)
+    temp_latest = latest.get(NETDATA_CHART_CPU_TEMP)
+    
+    net1_chart_res = latest.get(NETDATA_CHART_NET1) if NETDATA_CHART_NET1 else None
+    net1_iface_res = latest.get(net1_iface_chart) if net1_iface_chart else None
+    
+    net2_chart_res = latest.get(NETDATA_CHART_NET2) if NETDATA_CHART_NET2 else None
+    net2_iface_res = latest.get(net2_iface_chart) if net2_iface_chart else None
+
+    cpu_temp = _calc_cpu_temp(temp_latest)
+    # Numbers pushed over the TrueNAS WebSocket, if connected
+    realtime = _realtime_fields()
+
+    # TrueNAS fallbacks for NICs Netdata doesn't know: pushed realtime rates when
+    # available, otherwise reporting/get_data polls run in parallel
+    t_net1_truenas = None
+    net1_latest = None
+    if net1_chart_res:
+         net1_latest = _calc_net_io(net1_chart_res, NETDATA_LABEL_NET1)
+    
+    if not net1_latest and TRUENAS_INTERFACE_NET1:
+         if net1_iface_res: 
+             net1_latest = _calc_net_io(net1_iface_res, NETDATA_LABEL_NET1)
+         elif realtime and (rt_net := _realtime_net(realtime, TRUENAS_INTERFACE_NET1)):
+             net1_latest = {"label": NETDATA_LABEL_NET1, **rt_net}
+         else:
+             t_net1_truenas = _fanout.submit(_get_truenas_net_stats, TRUENAS_INTERFACE_NET1, timeout=6)
+
+    t_net2_truenas = None
+    net2_latest = None
+    if net2_chart_res:
+         net2_latest = _calc_net_io(net2_chart_res, NETDATA_LABEL_NET2)
+
+    if not net2_latest and TRUENAS_INTERFACE_NET2:
+         if net2_iface_res:
+             net2_latest = _calc_net_io(net2_iface_res, NETDATA_LABEL_NET2)
+         elif realtime and (rt_net := _realtime_net(realtime, TRUENAS_INTERFACE_NET2)):
+             net2_latest = {"label": NETDATA_LABEL_NET2, **rt_net}
+         else:
+             t_net2_truenas = _fanout.submit(_get_truenas_net_stats, TRUENAS_INTERFACE_NET2, timeout=6)
+
+    net1_truenas = get_res(t_net1_truenas)
+    if net1_truenas:
+        net1_latest = {"label": NETDATA_LABEL_NET1, "rx": net1_truenas["rx"], "tx": net1_truenas["tx"]}
+    net2_truenas = get_res(t_net2_truenas)
+    if net2_truenas:
+        net2_latest = {"label": NETDATA_LABEL_NET2, "rx": net2_truenas["rx"], "tx": net2_truenas["tx"]}
+
+    disks = get_res(t_datasets) or []
+    gpu_stats = _get_gpu_stats()
+
+    cpu_usage = _calc_cpu_usage(cpu_latest)
+    memory = _calc_memory(ram_latest)
+    disk_io = None
+    if realtime:
+        if cpu_usage is None:
+            cpu_usage = _realtime_cpu_usage(realtime)
+        if memory is None:
+            memory = _realtime_memory(realtime)
+        disk_io = _realtime_disk_io(realtime)
+
+    nets = []
+    if net1_latest:
+        nets.append({"label": net1_latest["label"], "rx": net1_latest["rx"], "tx": net1_latest["tx"]})
+    if net2_latest:
+        nets.append({"label": net2_latest["label"], "rx": net2_latest["rx"], "tx": net2_latest["tx"]})
+
+    return {
+        "gpu": gpu_stats,
+        "system_ip": TRUENAS_DISPLAY_IP,
+        "cpu_usage": cpu_usage,
+        "cpu_temp": cpu_temp,
+        "memory": memory,
+        "disks": disks,
+        "nets": nets,
+        "disk_io": disk_io,
+        "upstreams": {name: breaker.summary() for name, breaker in _breakers.items()},
+    }
+
+
+def _metrics_collector() -> None:
+    """Background loop: sample every source once per tick and publish a new snapshot."""
+    global _metrics_snapshot
+    seq = 0
+    app.logger.info(f"Metrics collector started (interval={METRICS_INTERVAL}s)")
+    while True:
+        started = time.time()
+        try:
+            data = _collect_metrics()
+        except Exception as exc:  # Never let the collector die
+            app.logger.error(f"Metrics Error: {exc}")
+            data = _empty_metrics(str(exc))
+        seq += 1
+        # Snapshots are never mutated after publishing; readers just grab the reference.
+        previous = _metrics_snapshot
+        _metrics_snapshot = MetricsSnapshot(seq, started, data)
+        _metrics_ready.set()
+        _record_history(_metrics_snapshot)
+        _broadcast_metrics(previous, _metrics_snapshot)
+        socketio.sleep(max(0.0, METRICS_INTERVAL - (time.time() - started)))
+
+
+def _start_metrics_collector() -> None:
+    global _metrics_collector_started
+    if _metrics_collector_started:
+        return
+    _metrics_collector_started = True
+    socketio.start_background_task(target=_metrics_collector)
+
+
+@app.route("/api/metrics")
+def api_metrics():
+    snapshot = _metrics_snapshot
+    if snapshot is None:
+        # First request after startup: wait for the collector's first tick
+        _metrics_ready.wait(timeout=METRICS_FIRST_WAIT)
+        snapshot = _metrics_snapshot
+    if snapshot is None:
+        return jsonify(_empty_metrics("Metrics collector is still warming up"))
+    return jsonify(snapshot.data)
+
+
+# --- Metric History ---
+# Fixed-size ring buffers (two float64 arrays per series) for every value the collector
+# produces, so sparklines survive a page reload. Memory is bounded by
+# HISTORY_MAX_SERIES * HISTORY_POINTS * 16 bytes no matter how long the app runs.
+HISTORY_POINTS = max(60, int(os.getenv("HISTORY_POINTS", "1800").strip() or "1800"))
+HISTORY_MAX_SERIES = 256
+HISTORY_DEFAULT_POINTS = 300
+
+_NAN = float("nan")
+
+
+class RingSeries:
+    __slots__ = ("times", "values", "head", "count")
+
+    def __init__(self, capacity: int):
+        self.times = array("d", [_NAN]) * capacity
+        self.values = array("d", [_NAN]) * capacity
+        self.head = 0  # next slot to write
+        self.count = 0
+
+    def append(self, ts: float, value: float | None) -> None:
+        capacity = len(self.times)
+        self.times[self.head] = ts
+        self.values[self.head] = _NAN if value is None else float(value)
+        self.head = (self.head + 1) % capacity
+        self.count = min(self.count + 1, capacity)
+
+    def window(self, since: float = 0.0) -> tuple[list[float], list[float]]:
+        """Samples newer than `since`, oldest first."""
+        capacity = len(self.times)
+        start = (self.head - self.count) % capacity
+        if start + self.count <= capacity:
+            times = self.times[start:start + self.count]
+            values = self.values[start:start + self.count]
+        else:
+            times = self.times[start:] + self.times[:self.head]
+            values = self.values[start:] + self.values[:self.head]
+        # Timestamps are monotonic, so bisect instead of scanning
+        first = bisect.bisect_right(times, since) if since else 0
+        return times[first:].tolist(), values[first:].tolist()
+
+    @property
+    def last_time(self) -> float | None:
+        return self.times[(self.head - 1) % len(self.times)] if self.count else None
+
+
+def _downsample(times: list[float], values: list[float], points: int) -> tuple[list[float], list[float | None]]:
+    """Average consecutive samples into at most `points` buckets; NaN gaps become None."""
+    n = len(times)
+    if n <= points:
+        return times, [None if math.isnan(v) else v for v in values]
+    step = n / points
+    out_t: list[float] = []
+    out_v: list[float | None] = []
+    for i in range(points):
+        lo, hi = int(i * step), int((i + 1) * step)
+        bucket = [v for v in values[lo:hi] if not math.isnan(v)]
+        out_t.append(times[hi - 1])
+        out_v.append(sum(bucket) / len(bucket) if bucket else None)
+    return out_t, out_v
+
+
+class MetricHistory:
+    def __init__(self, points: int, max_series: int):
+        self.points = points
+        self.max_series = max_series
+        self._series: dict[str, RingSeries] = {}
+        self._dropped: set[str] = set()
+
+    def record(self, name: str, ts: float, value: float | None) -> None:
+        series = self._series.get(name)
+        if series is None:
+            if len(self._series) >= self.max_series:
+                if name not in self._dropped:
+                    self._dropped.add(name)
+                    app.logger.warning(f"History series limit ({self.max_series}) reached; not recording {name}")
+                return
+            series = self._series[name] = RingSeries(self.points)
+        series.append(ts, value)
+
+    def names(self) -> list[str]:
+        return sorted(self._series)
+
+    def query(self, patterns: list[str], since: float, points: int) -> dict[str, dict]:
+        result = {}
+        for name in self.names():
+            if patterns and not any(fnmatch.fnmatchcase(name, p) for p in patterns):
+                continue
+            times, values = self._series[name].window(since)
+            times, values = _downsample(times, values, points)
+            result[name] = {"t": [round(t, 3) for t in times], "v": values}
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "series": len(self._series),
+            "points_per_series": self.points,
+            "bytes": len(self._series) * self.points * 16,
+            "dropped_series": len(self._dropped),
+        }
+
+
+def _history_values(data: dict) -> Iterator[tuple[str, float | None]]:
+    """Flatten one collector payload into (series name, value) pairs."""
+    yield "cpu.usage", data.get("cpu_usage")
+    yield "cpu.temp", data.get("cpu_temp")
+    memory = data.get("memory") or {}
+    for key in ("used_percent", "apps_percent", "cache_percent", "used", "apps", "cache"):
+        if key in memory:
+            yield f"memory.{key}", memory[key]
+    for net in data.get("nets") or []:
+        yield f"net.{net['label']}.rx", net.get("rx")
+        yield f"net.{net['label']}.tx", net.get("tx")
+    for disk in data.get("disks") or []:
+        yield f"dataset.{disk['label']}.used_percent", disk.get("used_percent")
+        yield f"dataset.{disk['label']}.used", disk.get("used")
+    for key, value in (data.get("disk_io") or {}).items():
+        yield f"disk_io.{key}", value
+    for gpu in (data.get("gpu") or {}).get("gpus") or []:
+        for key in ("utilization", "temperature", "memory_used"):
+            yield f"gpu.{gpu['index']}.{key}", gpu.get(key)
+
+
+_history = MetricHistory(HISTORY_POINTS, HISTORY_MAX_SERIES)
+
+
+def _record_sample(name: str, ts: float, value: float | None) -> None:
+    _history.record(name, ts, value)
+    if _metrics_store is not None:
+        try:
+            _metrics_store.record(name, ts, value)
+        except Exception as e:
+            app.logger.warning(f"Metric store write failed for {name}: {e}")
+
+
+def _record_history(snapshot: MetricsSnapshot) -> None:
+    for name, value in _history_values(snapshot.data):
+        if value is None or isinstance(value, (int, float)):
+            _record_sample(name, snapshot.timestamp, value)
+
+
+@app.route("/api/metrics/history")
+def api_metrics_history():
+    from flask import request as flask_request
+
+    raw_series = flask_request.args.get("series", "").strip()
+    patterns = [p.strip() for p in raw_series.split(",") if p.strip()]
+    try:
+        since = float(flask_request.args.get("since", "0") or 0)
+        points = int(flask_request.args.get("points", HISTORY_DEFAULT_POINTS) or HISTORY_DEFAULT_POINTS)
+    except ValueError:
+        return jsonify({"error": "since and points must be numbers"}), 400
+    if since < 0:
+        since = time.time() + since  # e.g. since=-600 for the last ten minutes
+    points = max(1, min(points, HISTORY_POINTS))
+
+    # Older than the ring buffers reach: answer from the on-disk store
+    if _metrics_store is not None and since and since < time.time() - HISTORY_POINTS * METRICS_INTERVAL:
+        tier = _metrics_store.pick_tier(since)
+        return jsonify({
+            "interval": tier.bucket or METRICS_INTERVAL,
+            "source": tier.name,
+            "series": _metrics_store.query(patterns, since, time.time(), points, tier),
+        })
+
+    return jsonify({
+        "interval": METRICS_INTERVAL,
+        "source": "memory",
+        "series": _history.query(patterns, since, points),
+    })
+
+
+# --- On-disk Metric Store ---
+# A tiny embedded time-series store so history survives restarts (every deploy.sh
+# rollout recreates the container). Each tier is a directory of segment files holding
+# fixed-width records, accessed through mmap:
+#   header:  magic, version, record size, record count          (16 bytes)
+#   record:  timestamp f64, series id u32, avg f32, min f32, max f32 (24 bytes)
+# Raw collector samples go to the first tier; a background task rolls complete
+# buckets up into the coarser tiers and deletes segments past their retention.
+# Segment files are named "<start>.seg" ("<start>_<n>.seg" if that name is taken).
+# One process owns the directory at a time, through an flock on its "lock" file.
+METRICS_STORE_ENABLED = os.getenv("METRICS_STORE", "1").strip().lower() not in {"0", "false", "no"}
+METRICS_STORE_DIR = data_dir / "tsdb"
+STORE_SEGMENT_RECORDS = 65536  # ~1.5 MB per segment; files are sparse until written
+STORE_MAINTAIN_INTERVAL = 60
+# (name, bucket seconds, retention seconds); bucket 0 = raw collector samples
+STORE_TIERS = (
+    ("raw", 0, 3600),
+    ("1m", 60, 7 * 86400),
+    ("1h", 3600, 365 * 86400),
+)
+
+_SEG_HEADER = struct.Struct("<4sHHQ")
+_SEG_RECORD = struct.Struct("<dIfff")
+_SEG_MAGIC = b"TSDB"
+_SEG_VERSION = 1
+
+
+def _segment_start(path: Path) -> float:
+    return float(path.stem.partition("_")[0])
+
+
+def _segment_order(path: Path) -> tuple[float, int]:
+    start, _, n = path.stem.partition("_")
+    return float(start), int(n or 0)
+
+
+class _Segment:
+    def __init__(self, path: Path, create: bool = False):
+        self.path = path
+        if create:
+            with open(path, "wb") as f:
+                f.truncate(_SEG_HEADER.size + STORE_SEGMENT_RECORDS * _SEG_RECORD.size)
+                f.write(_SEG_HEADER.pack(_SEG_MAGIC, _SEG_VERSION, _SEG_RECORD.size, 0))
+        self._file = open(path, "r+b")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0)
+        except Exception:
+            self._file.close()
+            raise
+        magic, version, record_size, count = _SEG_HEADER.unpack_from(self._mm, 0)
+        if magic != _SEG_MAGIC or version != _SEG_VERSION or record_size != _SEG_RECORD.size:
+            self.close()
+            raise ValueError(f"{path.name}: not a version {_SEG_VERSION} segment")
+        self.capacity = (len(self._mm) - _SEG_HEADER.size) // _SEG_RECORD.size
+        self.count = min(count, self.capacity)
+        self.start = _segment_start(path)
+        self.end = self.start
+        if self.count:
+            self.end = _SEG_RECORD.unpack_from(self._mm, self._offset(self.count - 1))[0]
+
+    @staticmethod
+    def _offset(i: int) -> int:
+        return _SEG_HEADER.size + i * _SEG_RECORD.size
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+    def append(self, ts: float, sid: int, avg: float, lo: float, hi: float) -> None:
+        _SEG_RECORD.pack_into(self._mm, self._offset(self.count), ts, sid, avg, lo, hi)
+        self.count += 1
+        # Bump the count only after the record is in place, so a crash never exposes garbage
+        _SEG_HEADER.pack_into(self._mm, 0, _SEG_MAGIC, _SEG_VERSION, _SEG_RECORD.size, self.count)
+        self.end = max(self.end, ts)
+
+    def records(self) -> Iterator[tuple[float, int, float, float, float]]:
+        view = memoryview(self._mm)[_SEG_HEADER.size:self._offset(self.count)]
+        try:
+            yield from _SEG_RECORD.iter_unpack(view)
+        finally:
+            view.release()
+
+    def flush(self) -> None:
+        self._mm.flush()
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+class _Tier:
+    def __init__(self, root: Path, name: str, bucket: int, retention: int):
+        self.name = name
+        self.bucket = bucket
+        self.retention = retention
+        self.dir = root / name
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.segments: list[_Segment] = []
+        paths = []
+        for path in self.dir.glob("*.seg"):
+            try:
+                paths.append((_segment_order(path), path))
+            except ValueError:
+                app.logger.warning(f"Metric store: skipping {self.name}/{path.name}: unexpected name")
+        for _, path in sorted(paths):
+            try:
+                self.segments.append(_Segment(path))
+            except (OSError, ValueError) as e:
+                app.logger.warning(f"Metric store: skipping {self.name}/{path.name}: {e}")
+
+    def append(self, ts: float, sid: int, avg: float, lo: float, hi: float) -> None:
+        # Rotate on size or on a quarter of the retention, so pruning stays fine-grained
+        if not self.segments or self.segments[-1].full or ts - self.segments[-1].start > self.retention / 4:
+            path = self.dir / f"{ts:.3f}.seg"
+            n = 0
+            while path.exists():  # same-millisecond rollover; the record keeps its timestamp
+                n += 1
+                path = self.dir / f"{ts:.3f}_{n}.seg"
+            self.segments.append(_Segment(path, create=True))
+        self.segments[-1].append(ts, sid, avg, lo, hi)
+
+    def scan(self, since: float, until: float) -> Iterator[tuple[float, int, float, float, float]]:
+        for seg in list(self.segments):
+            if seg.end < since or seg.start > until:
+                continue
+            for rec in seg.records():
+                if since <= rec[0] <= until:
+                    yield rec
+
+    def last_time(self) -> float | None:
+        return self.segments[-1].end if self.segments and self.segments[-1].count else None
+
+    def max_series_id(self) -> int:
+        return max((rec[1] for seg in self.segments for rec in seg.records()), default=-1)
+
+    def prune(self, now: float) -> None:
+        # Never drop the segment currently being written
+        while len(self.segments) > 1 and self.segments[0].end < now - self.retention:
+            seg = self.segments.pop(0)
+            seg.close()
+            seg.path.unlink(missing_ok=True)
+
+    def flush(self) -> None:
+        for seg in self.segments[-2:]:
+            seg.flush()
+
+    def stats(self) -> dict:
+        return {
+            "bucket": self.bucket,
+            "retention": self.retention,
+            "segments": len(self.segments),
+            "records": sum(s.count for s in self.segments),
+        }
+
+
+class MetricStore:
+    def __init__(self, root: Path):
+        self.root = root
+        root.mkdir(parents=True, exist_ok=True)
+        # Raises BlockingIOError while another process has the store open
+        self._lock_file = open(root / "lock", "a+b")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise
+        self._series_file = root / "series.json"
+        self.tiers = [_Tier(root, *spec) for spec in STORE_TIERS]
+        self._ids: dict[str, int] = {}
+        self._next_id = 0
+        try:
+            self._ids = {str(k): int(v) for k, v in json.loads(self._series_file.read_text()).items()}
+            self._next_id = max(self._ids.values(), default=-1) + 1
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError, AttributeError) as e:
+            # Names can't be recovered from the segments (they only hold ids): keep the
+            # old samples out of queries by numbering new series after every stored id
+            app.logger.warning(f"Metric store: {self._series_file.name} is unreadable ({e}); starting a new series index")
+            os.replace(self._series_file, self._series_file.with_suffix(".json.corrupt"))
+            self._next_id = max(t.max_series_id() for t in self.tiers) + 1
+        self._names = {v: k for k, v in self._ids.items()}
+
+    def _series_id(self, name: str) -> int:
+        sid = self._ids.get(name)
+        if sid is None:
+            sid = self._next_id
+            self._next_id += 1
+            self._ids[name] = sid
+            self._names[sid] = name
+            tmp = self._series_file.with_suffix(".json.tmp")
+            tmp.write_text(json.dumps(self._ids, sort_keys=True))
+            os.replace(tmp, self._series_file)
+        return sid
+
+    def record(self, name: str, ts: float, value: float | None) -> None:
+        if value is None:
+            return
+        v = float(value)
+        self.tiers[0].append(ts, self._series_id(name), v, v, v)
+
+    def _rollup(self, src: _Tier, dst: _Tier, now: float) -> None:
+        # Only whole buckets are rolled up; the watermark is the last bucket written
+        end = math.floor(now / dst.bucket) * dst.bucket
+        last = dst.last_time()
+        start = last + dst.bucket if last is not None else 0.0
+        if end <= start:
+            return
+        acc: dict[tuple[float, int], list[float]] = {}
+        for ts, sid, avg, lo, hi in src.scan(start, end):
+            if ts >= end:
+                continue
+            key = (math.floor(ts / dst.bucket) * dst.bucket, sid)
+            a = acc.get(key)
+            if a is None:
+                acc[key] = [avg, 1, lo, hi]
+            else:
+                a[0] += avg
+                a[1] += 1
+                a[2] = min(a[2], lo)
+                a[3] = max(a[3], hi)
+        for (bucket, sid), (total, n, lo, hi) in sorted(acc.items()):
+            dst.append(bucket, sid, total / n, lo, hi)
+
+    def maintain(self, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        for src, dst in zip(self.tiers, self.tiers[1:]):
+            self._rollup(src, dst, now)
+        for tier in self.tiers:
+            tier.prune(now)
+            tier.flush()
+
+    def pick_tier(self, since: float, now: float | None = None) -> _Tier:
+        """Finest tier whose retention still covers `since`."""
+        now = time.time() if now is None else now
+        for tier in self.tiers:
+            if since >= now - tier.retention:
+                return tier
+        return self.tiers[-1]
+
+    def query(self, patterns: list[str], since: float, until: float, points: int,
+              tier: _Tier | None = None) -> dict[str, dict]:
+        tier = tier or self.pick_tier(since)
+        wanted = {
+            sid for name, sid in self._ids.items()
+            if not patterns or any(fnmatch.fnmatchcase(name, p) for p in patterns)
+        }
+        rows: dict[int, tuple[list[float], list[float]]] = {}
+        for ts, sid, avg, _lo, _hi in tier.scan(since, until):
+            if sid in wanted:
+                times, values = rows.setdefault(sid, ([], []))
+                times.append(ts)
+                values.append(avg)
+        result = {}
+        for sid in sorted(rows, key=self._names.__getitem__):
+            times, values = _downsample(*rows[sid], points)
+            result[self._names[sid]] = {"t": [round(t, 3) for t in times], "v": values}
+        return result
+
+    def load_into(self, history: MetricHistory, since: float) -> int:
+        """Replay recent raw samples into the in-memory ring buffers."""
+        n = 0
+        for ts, sid, avg, _lo, _hi in self.tiers[0].scan(since, float("inf")):
+            name = self._names.get(sid)
+            if name is not None:
+                history.record(name, ts, avg)
+                n += 1
+        return n
+
+    def stats(self) -> dict:
+        return {
+            "path": str(self.root),
+            "series": len(self._ids),
+            "tiers": {t.name: t.stats() for t in self.tiers},
+        }
+
+
+_metrics_store: MetricStore | None = None
+_metrics_store_started = False
+
+
+def _metrics_store_maintainer() -> None:
+    while True:
+        socketio.sleep(STORE_MAINTAIN_INTERVAL)
+        try:
+            _metrics_store.maintain()
+        except Exception as e:
+            app.logger.warning(f"Metric store maintenance failed: {e}")
+
+
+def _start_metrics_store() -> None:
+    """Open the store and reload recent history; must run before the collector starts."""
+    global _metrics_store, _metrics_store_started
+    if _metrics_store_started or not METRICS_STORE_ENABLED:
+        return
+    _metrics_store_started = True
+    try:
+        store = MetricStore(METRICS_STORE_DIR)
+        store.maintain()
+        loaded = store.load_into(_history, time.time() - HISTORY_POINTS * METRICS_INTERVAL)
+    except BlockingIOError:
+        app.logger.warning(f"Metric store disabled, {METRICS_STORE_DIR} is in use by another process")
+        return
+    except Exception as e:
+        app.logger.error(f"Metric store disabled, cannot open {METRICS_STORE_DIR}: {e}")
+        return
+    _metrics_store = store
+    app.logger.info(f"Metric store opened at {METRICS_STORE_DIR} ({loaded} recent samples reloaded)")
+    socketio.start_background_task(target=_metrics_store_maintainer)
+
+
+# --- Live Metrics Push (Socket.IO /metrics) ---
+# Subscribers get one full frame on connect, then one broadcast per collector tick
+# carrying only what changed, as an RFC 7396 JSON merge patch:
+#   {"seq": 12, "full": {...}}              full snapshot
+#   {"seq": 13, "base": 12, "patch": {...}}  apply to snapshot `base` to get `seq`
+# A client whose last seq != base emits 'resync' to get a new full frame.
+
+_metrics_subscribers = 0
+
+
+def _merge_patch(old: dict, new: dict) -> dict:
+    """Build the JSON merge patch that turns `old` into `new` (lists are replaced whole)."""
+    patch: dict = {}
+    for key in old.keys() - new.keys():
+        patch[key] = None
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+        elif old[key] == value:
+            continue
+        elif isinstance(value, dict) and isinstance(old[key], dict):
+            patch[key] = _merge_patch(old[key], value)
+        else:
+            patch[key] = value
+    return patch
+
+
+def _broadcast_metrics(previous: MetricsSnapshot | None, snapshot: MetricsSnapshot) -> None:
+    if previous is None or not _metrics_subscribers:
+        return
+    frame = {"seq": snapshot.seq, "base": previous.seq, "patch": _merge_patch(previous.data, snapshot.data)}
+    try:
+        # One emit for every subscriber on the namespace
+        socketio.emit('metrics', frame, namespace='/metrics')
+    except Exception as e:
+        app.logger.warning(f"Metrics broadcast failed: {e}")
+
+
+def _emit_full_metrics() -> None:
+    snapshot = _metrics_snapshot
+    if snapshot is not None:
+        emit('metrics', {"seq": snapshot.seq, "full": snapshot.data})
+
+
+@socketio.on('connect', namespace='/metrics')
+def connect_metrics():
+    global _metrics_subscribers
+    _metrics_subscribers += 1
+    _emit_full_metrics()
+
+
+@socketio.on('disconnect', namespace='/metrics')
+def disconnect_metrics():
+    global _metrics_subscribers
+    _metrics_subscribers = max(0, _metrics_subscribers - 1)
+
+
+@socketio.on('resync', namespace='/metrics')
+def resync_metrics():
+    _emit_full_metrics()
+
+
+@app.route("/api/netdata/charts")
+def api_netdata_charts():
+    try:
+        data = _fetch_netdata("/api/v1/charts")
+        return jsonify(data or {})
+    except requests.exceptions.RequestException as exc:
+        return (
+            jsonify(_format_request_error("Failed to reach Netdata", exc)),
+            502,
         )
     except Exception as exc:  # noqa: BLE001
         return jsonify({"error": "Unexpected error", "details": str(exc)}), 500
@@ -757,14 +2626,25 @@ def api_stats():
         if not TRUENAS_HOST or not TRUENAS_API_KEY:
             return jsonify({"error": "Missing TRUENAS_HOST or TRUENAS_API_KEY"}), 500
 
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            f_sys = executor.submit(_fetch_truenas, "/api/v2.0/system/info")
-            f_pools = executor.submit(_fetch_truenas, "/api/v2.0/pool")
-            f_disks = executor.submit(_get_disk_info)
+        t_sys = _fanout.submit(_fetch_truenas, "/api/v2.0/system/info", timeout=STATS_TASK_TIMEOUT)
+        t_pools = _fanout.submit(_fetch_truenas_cached, "/api/v2.0/pool", timeout=STATS_TASK_TIMEOUT)
+        t_disks = _fanout.submit(_get_disk_info, False, timeout=STATS_TASK_TIMEOUT)
 
-            system_info = f_sys.result()
-            pools = f_pools.result()
-            disks_info = f_disks.result()
+        try:
+            system_info = t_sys.result()
+            pools = t_pools.result()
+            disks_info = t_disks.result()
+        finally:
+            # If one task failed, don't leave the others running for nobody
+            for task in (t_sys, t_pools, t_disks):
+                task.cancel()
+
+        if disks_info:
+            t_temps = _fanout.submit(_fill_missing_disk_temps, disks_info, timeout=STATS_DISK_TEMP_TIMEOUT)
+            try:
+                t_temps.result()
+            except TimeoutError as e:
+                app.logger.info(f"Disk temperature fallback cut short: {e}")
 
         uptime = system_info.get("uptime") or system_info.get("uptime_seconds")
         load = (
@@ -801,6 +2681,8 @@ def api_stats():
             jsonify({"error": "Failed to reach TrueNAS", "details": str(exc)}),
             502,
         )
+    except TimeoutError as exc:
+        return jsonify({"error": "TrueNAS request timed out", "details": str(exc)}), 504
     except Exception as exc:  # noqa: BLE001
         return jsonify({"error": "Unexpected error", "details": str(exc)}), 500
 
@@ -813,23 +2695,31 @@ def _get_truenas_net_stats(identifier: str) -> dict | None:
     if identifier in _net_stats_cache:
         ts, val = _net_stats_cache[identifier]
         if now - ts < CACHE_DURATION_NET:
+            _net_stats_cache_events.inc("hit")
             return val
+    _net_stats_cache_events.inc("miss")
 
     try:
         payload = {
             "graphs": [{"name": "interface", "identifier": identifier}]
         }
-        resp = requests.post(
-            f"{_build_base_url()}/api/v2.0/reporting/get_data",
-            headers=_build_headers(),
-            json=payload,
-            verify=(TRUENAS_VERIFY_SSL not in {"false", "0", "no"}),
-            timeout=5
-        )
-        if resp.status_code != 200:
-            return None
-        
-        data = resp.json()
+
+        def _post():
+            with _breakers["truenas"].call("/api/v2.0/reporting/get_data") as timeout, \
+                    _upstream_seconds.time("truenas", "/api/v2.0/reporting/get_data"):
+                resp = _truenas_session.post(
+                    f"{_build_base_url()}/api/v2.0/reporting/get_data",
+                    json=payload,
+                    verify=_TRUENAS_VERIFY,
+                    timeout=timeout
+                )
+                if resp.status_code >= 500:
+                    resp.raise_for_status()
+                if resp.status_code != 200:
+                    return None
+                return resp.json()
+
+        data = _upstream_flight.do(_flight_key("truenas", "POST", "/api/v2.0/reporting/get_data", payload), _post)
         if not data or not isinstance(data, list):
             return None
             
@@ -876,134 +2766,818 @@ def _get_truenas_net_stats(identifier: str) -> dict | None:
         _net_stats_cache[identifier] = (now, result)
         return result
 
+    except CircuitOpenError:
+        return None
     except Exception as e:
         app.logger.warning(f"Failed to fetch net stats for {identifier}: {e}")
         return None
 
 
-# --- SSH WebSocket Logic ---
+# --- TrueNAS WebSocket Client ---
+# One authenticated JSON-RPC 2.0 connection to the TrueNAS 25.x WebSocket API
+# (/api/current). Calls are multiplexed by request id; subscriptions arrive as
+# "collection_update" notifications. Realtime CPU / memory / interface / disk numbers
+# are kept in memory for the collector, and pool / disk changes invalidate the REST
+# cache instead of waiting for its TTL. The connection is re-established (and every
+# subscription re-sent) with exponential backoff whenever it drops.
+TRUENAS_WS_ENABLED = os.getenv("TRUENAS_WS", "1").strip().lower() not in {"0", "false", "no"}
+TRUENAS_WS_PATH = os.getenv("TRUENAS_WS_PATH", "/api/current").strip() or "/api/current"
+TRUENAS_WS_CALL_TIMEOUT = 10
+TRUENAS_WS_MAX_BACKOFF = 60
+TRUENAS_WS_PING_INTERVAL = 25
+REALTIME_MAX_AGE = 10  # seconds before pushed realtime numbers are ignored
+
+# Collections whose change events make cached REST responses stale
+_WS_INVALIDATES = {
+    "pool.query": {"/api/v2.0/pool", "dataset-index"},
+    "pool.dataset.query": {"dataset-index"},
+    "disk.query": {"/api/v2.0/disk"},
+}
+
+
+class TrueNASRPCError(Exception):
+    def __init__(self, error: dict):
+        self.error = error
+        super().__init__(error.get("message") or str(error))
+
+
+class TrueNASWebSocket:
+    def __init__(self, url: str, api_key: str, verify: bool = True):
+        self.url = url
+        self.api_key = api_key
+        self.ssl_context = None
+        if url.startswith("wss:") and not verify:
+            self.ssl_context = ssl.create_default_context()
+            self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+        self._ws = None
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending: dict[int, eventlet.event.Event] = {}
+        self._subscriptions: dict[str, list] = {}
+        self._connected = threading.Event()
+        self._started = False
+        self.connects = 0
+        self.calls = 0
+        self.events = 0
+        self.errors = 0
+        self.last_error: str | None = None
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        socketio.start_background_task(target=self._run)
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def subscribe(self, name: str, callback) -> None:
+        """Register `callback(params)` for a collection; re-sent after every reconnect."""
+        first = name not in self._subscriptions
+        self._subscriptions.setdefault(name, []).append(callback)
+        if first and self.connected:
+            try:
+                self._call("core.subscribe", [name])
+            except Exception as e:
+                app.logger.warning(f"TrueNAS WS: subscribe {name} failed: {e}")
+
+    def call(self, method: str, params: list | None = None, timeout: float = TRUENAS_WS_CALL_TIMEOUT):
+        if not self._connected.wait(timeout):
+            raise ConnectionError("TrueNAS WebSocket is not connected")
+        return self._call(method, params, timeout)
+
+    def _call(self, method: str, params: list | None = None, timeout: float = TRUENAS_WS_CALL_TIMEOUT):
+        ws = self._ws
+        if ws is None:
+            raise ConnectionError("TrueNAS WebSocket is not connected")
+        msg_id = next(self._ids)
+        waiter = eventlet.event.Event()
+        self._pending[msg_id] = waiter
+        self.calls += 1
+        with _upstream_seconds.time("truenas_ws", method):
+            try:
+                payload = json.dumps({"jsonrpc": "2.0", "id": msg_id, "method": method, "params": params or []})
+                with self._send_lock:
+                    ws.send(payload)
+                reply = waiter.wait(timeout)
+            finally:
+                self._pending.pop(msg_id, None)
+            if reply is None:
+                raise TimeoutError(f"TrueNAS WebSocket call {method} timed out")
+            if "error" in reply:
+                raise TrueNASRPCError(reply["error"] or {})
+            return reply.get("result")
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            reader = None
+            try:
+                with eventlet.Timeout(TRUENAS_WS_CALL_TIMEOUT, ConnectionError("connect timed out")):
+                    self._ws = simple_websocket.Client.connect(
+                        self.url, ssl_context=self.ssl_context, ping_interval=TRUENAS_WS_PING_INTERVAL
+                    )
+                reader = eventlet.spawn(self._read_loop, self._ws)
+                if self._call("auth.login_with_api_key", [self.api_key]) is not True:
+                    raise PermissionError("API key rejected")
+                for name in list(self._subscriptions):
+                    self._call("core.subscribe", [name])
+                self.connects += 1
+                self._connected.set()
+                app.logger.info(f"TrueNAS WS connected ({len(self._subscriptions)} subscriptions)")
+                backoff = 1.0
+                reader.wait()
+            except PermissionError as e:
+                self._note_error(e)
+                backoff = TRUENAS_WS_MAX_BACKOFF
+            except Exception as e:
+                self._note_error(e)
+            finally:
+                was_connected = self._connected.is_set()
+                self._connected.clear()
+                self._close(reader)
+                if was_connected:
+                    app.logger.info("TrueNAS WS disconnected; reconnecting")
+            socketio.sleep(backoff)
+            backoff = min(backoff * 2, TRUENAS_WS_MAX_BACKOFF)
+
+    def _note_error(self, exc: Exception) -> None:
+        self.errors += 1
+        message = f"{type(exc).__name__}: {exc}"
+        if message != self.last_error:
+            # Log each distinct failure once instead of every retry
+            app.logger.warning(f"TrueNAS WS: {message}")
+        self.last_error = message
+
+    def _close(self, reader) -> None:
+        ws, self._ws = self._ws, None
+        if reader is not None:
+            reader.kill()
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+        for waiter in list(self._pending.values()):
+            if not waiter.ready():
+                waiter.send_exception(ConnectionError("TrueNAS WebSocket connection lost"))
+        self._pending.clear()
+
+    def _read_loop(self, ws) -> None:
+        while True:
+            try:
+                raw = ws.receive()
+            except simple_websocket.ConnectionClosed:
+                return
+            if raw is None:
+                continue
+            try:
+                msg = json.loads(raw)
+            except ValueError:
+                continue
+            msg_id = msg.get("id")
+            if msg_id is not None:
+                waiter = self._pending.get(msg_id)
+                if waiter is not None and not waiter.ready():
+                    waiter.send(msg)
+            elif msg.get("method") == "collection_update":
+                params = msg.get("params") or {}
+                self.events += 1
+                for callback in self._subscriptions.get(params.get("collection"), ()):
+                    try:
+                        callback(params)
+                    except Exception as e:
+                        app.logger.warning(f"TrueNAS WS: handler for {params.get('collection')} failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "connected": self.connected,
+            "connects": self.connects,
+            "calls": self.calls,
+            "events": self.events,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "subscriptions": sorted(self._subscriptions),
+            "pending": len(self._pending),
+        }
 
-ssh_client = None
-ssh_channel = None
 
-@socketio.on('connect', namespace='/ssh')
-def connect_ssh():
-    """Client connected via WebSocket"""
-    print("Client connected via WebSocket")
-    # 強制重置連線，確保每次進入 Terminal 都是新的 Session
-    global ssh_client, ssh_channel
-    if ssh_client:
+_truenas_ws: TrueNASWebSocket | None = None
+_truenas_realtime: tuple[float, dict] | None = None  # (received_at, fields)
+
+
+def _on_realtime(params: dict) -> None:
+    global _truenas_realtime
+    fields = params.get("fields")
+    if isinstance(fields, dict):
+        _truenas_realtime = (time.time(), fields)
+
+
+def _on_inventory_change(params: dict) -> None:
+    paths = _WS_INVALIDATES.get(params.get("collection"), set())
+    dropped = _truenas_cache_store.invalidate(lambda key: key[0] in paths)
+    if dropped:
+        app.logger.debug(f"TrueNAS WS: {params.get('collection')} {params.get('msg')}; dropped {dropped} cache entries")
+
+
+def _realtime_fields() -> dict | None:
+    snapshot = _truenas_realtime
+    if snapshot is None or time.time() - snapshot[0] > REALTIME_MAX_AGE:
+        return None
+    return snapshot[1]
+
+
+def _realtime_cpu_usage(fields: dict) -> float | None:
+    cpu = fields.get("cpu") or {}
+    for key in ("cpu", "average"):
+        entry = cpu.get(key)
+        if isinstance(entry, dict) and entry.get("usage") is not None:
+            return float(entry["usage"])
+    return None
+
+
+def _realtime_memory(fields: dict) -> dict | None:
+    mem = fields.get("memory") or {}
+    total = mem.get("physical_memory_total")
+    available = mem.get("physical_memory_available")
+    if not total or available is None:
+        return None
+    # Same shape as _calc_memory(), in MiB like Netdata's system.ram
+    mib = 1024.0 * 1024.0
+    total = float(total)
+    used = total - float(available)
+    cache = float(mem.get("arc_size") or 0.0)
+    apps = max(0.0, used - cache)
+    return {
+        "used": used / mib,
+        "total": total / mib,
+        "used_percent": used / total * 100.0,
+        "apps": apps / mib,
+        "cache": cache / mib,
+        "apps_percent": apps / total * 100.0,
+        "cache_percent": cache / total * 100.0,
+    }
+
+
+def _realtime_net(fields: dict, iface: str) -> dict | None:
+    entry = (fields.get("interfaces") or {}).get(iface)
+    if not isinstance(entry, dict):
+        return None
+    rx = entry.get("received_bytes_rate")
+    tx = entry.get("sent_bytes_rate")
+    if rx is None or tx is None:
+        return None
+    return {"rx": float(rx), "tx": float(tx)}
+
+
+def _realtime_disk_io(fields: dict) -> dict | None:
+    disks = fields.get("disks")
+    if not isinstance(disks, dict):
+        return None
+    keys = ("read_bytes", "write_bytes", "read_ops", "write_ops", "busy")
+    return {k: disks[k] for k in keys if k in disks} or None
+
+
+def _start_truenas_ws() -> None:
+    global _truenas_ws
+    if _truenas_ws is not None or not TRUENAS_WS_ENABLED or not TRUENAS_HOST or not TRUENAS_API_KEY:
+        return
+    if _upstream_replay is not None:
+        # replayed REST responses stand in for the live feed
+        return
+    base = _build_base_url()
+    url = ("wss" + base[len("https"):] if base.startswith("https") else "ws" + base[len("http"):]) + TRUENAS_WS_PATH
+    _truenas_ws = TrueNASWebSocket(url, TRUENAS_API_KEY, verify=_TRUENAS_VERIFY)
+    _truenas_ws.subscribe("reporting.realtime", _on_realtime)
+    for collection in _WS_INVALIDATES:
+        _truenas_ws.subscribe(collection, _on_inventory_change)
+    _truenas_ws.start()
+
+
+# --- SSH Connection Pool ---
+# Authenticated transports are kept alive per (host, user, auth method) and every
+# command gets its own exec channel on them, so _ssh_exec no longer pays a key
+# exchange + auth per call. The private key is parsed once at startup.
+
+SSH_POOL_MAX_CHANNELS = 8  # OpenSSH MaxSessions defaults to 10
+SSH_POOL_IDLE_TIMEOUT = 300
+
+
+def _load_ssh_private_key() -> paramiko.PKey | None:
+    b64_key = os.getenv('SSH_PRIVATE_KEY_B64')
+    if not b64_key:
+        return None
+    try:
+        key_str = base64.b64decode(b64_key).decode('utf-8')
+    except Exception as e:
+        app.logger.error(f"SSH_PRIVATE_KEY_B64 is not valid base64: {e}")
+        return None
+    # 嘗試檢測 Key 類型，預設嘗試 Ed25519，失敗則 RSA
+    for key_cls in (paramiko.Ed25519Key, paramiko.RSAKey):
+        try:
+            return key_cls.from_private_key(io.StringIO(key_str))
+        except Exception:
+            continue
+    app.logger.error("Failed to load SSH private key (tried Ed25519 and RSA)")
+    return None
+
+
+_SSH_PKEY = _load_ssh_private_key()
+
+
+class _SSHConnection:
+    def __init__(self, key: tuple, client: paramiko.SSHClient, max_channels: int):
+        self.key = key
+        self.client = client
+        self.transport = client.get_transport()
+        self.slots = threading.BoundedSemaphore(max_channels)
+        self.active = 0
+        self.last_used = time.time()
+
+    def healthy(self) -> bool:
+        return self.transport is not None and self.transport.is_active() and self.transport.is_authenticated()
+
+    def close(self) -> None:
         try:
-            ssh_client.close()
-        except:
+            self.client.close()
+        except Exception:
             pass
-    ssh_client = None
-    ssh_channel = None
-    init_ssh_connection()
+
+
+class SSHPool:
+    def __init__(self, max_channels: int, idle_timeout: float):
+        self.max_channels = max_channels
+        self.idle_timeout = idle_timeout
+        self._conns: dict[tuple, _SSHConnection] = {}
+        self._connect_locks: dict[tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._reaper_started = False
+        self.connects = 0
+        self.reuses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(host: str, user: str, password: str | None) -> tuple:
+        if _SSH_PKEY is not None or os.getenv('SSH_PRIVATE_KEY_B64'):
+            return (host, user, "pkey")
+        # Never share a transport between callers that supplied different passwords
+        digest = hashlib.sha256((password or "").encode()).hexdigest()
+        return (host, user, f"password:{digest}")
+
+    @staticmethod
+    def _connect(host: str, user: str, password: str | None, timeout: float) -> paramiko.SSHClient:
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            if os.getenv('SSH_PRIVATE_KEY_B64'):
+                if _SSH_PKEY is None:
+                    raise paramiko.SSHException("SSH_PRIVATE_KEY_B64 could not be parsed")
+                client.connect(host, username=user, pkey=_SSH_PKEY, timeout=timeout)
+            else:
+                client.connect(host, username=user, password=password, timeout=timeout)
+        except Exception:
+            client.close()
+            raise
+        client.get_transport().set_keepalive(30)
+        return client
+
+    def _get(self, host: str, user: str, password: str | None) -> _SSHConnection:
+        key = self._key(host, user, password)
+        with self._lock:
+            connect_lock = self._connect_locks.setdefault(key, threading.Lock())
+        with connect_lock:
+            conn = self._conns.get(key)
+            if conn is not None:
+                if conn.healthy():
+                    self.reuses += 1
+                    return conn
+                self._drop(conn)
+            # Only the handshake is timed; waiting for a slot is local contention
+            with _breakers["ssh"].measure("connect") as connect_timeout:
+                client = self._connect(host, user, password, connect_timeout)
+            conn = _SSHConnection(key, client, self.max_channels)
+            with self._lock:
+                self._conns[key] = conn
+            self.connects += 1
+        self._start_reaper()
+        return conn
+
+    def _drop(self, conn: _SSHConnection) -> None:
+        with self._lock:
+            if self._conns.get(conn.key) is conn:
+                del self._conns[conn.key]
+                self.evictions += 1
+        conn.close()
+
+    def _release(self, conn: _SSHConnection) -> None:
+        conn.active -= 1
+        conn.last_used = time.time()
+        conn.slots.release()
+
+    def _open_channel(self, host: str, user: str, password: str | None, timeout: float) -> tuple[_SSHConnection, paramiko.Channel]:
+        for attempt in (0, 1):
+            conn = self._get(host, user, password)
+            if not conn.slots.acquire(timeout=timeout):
+                raise SSHChannelsBusy(f"No free SSH channel to {host} after {timeout}s")
+            conn.active += 1
+            try:
+                with _breakers["ssh"].measure("open_session") as open_timeout:
+                    return conn, conn.transport.open_session(timeout=open_timeout)
+            except (paramiko.SSHException, EOFError, OSError):
+                # Transport died since the health check: reconnect once
+                self._release(conn)
+                self._drop(conn)
+                if attempt:
+                    raise
+
+    @contextmanager
+    def _closing(self, conn: _SSHConnection, chan: paramiko.Channel):
+        try:
+            yield chan
+        finally:
+            try:
+                chan.close()
+            finally:
+                self._release(conn)
+
+    @contextmanager
+    def channel(self, host: str, user: str, password: str | None = None, timeout: float = 30,
+                judge_output: bool = False):
+        """Yield a fresh session channel on a pooled transport; closed on exit.
+
+        The SSH breaker judges the connect and channel open. With judge_output it also
+        judges the caller's block, so a host that opens channels but then stalls on
+        reads still trips it; long-lived channels (terminals) leave that off.
+        """
+        breaker = _breakers["ssh"]
+        if judge_output:
+            with breaker.guard():
+                conn, chan = self._open_channel(host, user, password, timeout)
+                with self._closing(conn, chan):
+                    yield chan
+            return
+        with breaker.guard():
+            conn, chan = self._open_channel(host, user, password, timeout)
+        with self._closing(conn, chan):
+            yield chan
+
+    def _start_reaper(self) -> None:
+        if self._reaper_started:
+            return
+        self._reaper_started = True
+        socketio.start_background_task(target=self._reap)
+
+    def _reap(self) -> None:
+        while True:
+            socketio.sleep(max(5.0, self.idle_timeout / 4))
+            now = time.time()
+            with self._lock:
+                stale = [
+                    c for c in self._conns.values()
+                    if not c.healthy() or (c.active == 0 and now - c.last_used > self.idle_timeout)
+                ]
+            for conn in stale:
+                self._drop(conn)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            conns = list(self._conns.values())
+        return {
+            "connections": len(conns),
+            "active_channels": sum(c.active for c in conns),
+            "connects": self.connects,
+            "reuses": self.reuses,
+            "evictions": self.evictions,
+        }
+
+
+_ssh_pool = SSHPool(SSH_POOL_MAX_CHANNELS, SSH_POOL_IDLE_TIMEOUT)
+
+
+# --- SSH WebSocket Logic ---
+
+# Terminal output is pumped as raw bytes (xterm.js decodes UTF-8 itself, so characters
+# split across reads stay intact), coalesced into at most TERMINAL_MAX_FPS frames/s.
+TERMINAL_READ_BYTES = 64 * 1024
+TERMINAL_MAX_FRAME = 256 * 1024
+TERMINAL_MAX_FPS = 30
+# One shell per browser terminal, each a channel on the pooled SSH transport
+TERMINAL_MAX_SESSIONS = max(1, int(os.getenv("TERMINAL_MAX_SESSIONS", "4").strip() or "4"))
+TERMINAL_IDLE_TIMEOUT = max(60, int(os.getenv("TERMINAL_IDLE_TIMEOUT", "1800").strip() or "1800"))
+# A disconnected terminal keeps its shell this long so a reload / reconnect can reattach
+TERMINAL_DETACH_GRACE = 120
+# Flow control: stop reading the channel once this many emitted bytes are unacknowledged
+# by the browser, resume below the low mark. The SSH window then throttles the remote side.
+TERMINAL_HIGH_WATERMARK = 512 * 1024
+TERMINAL_LOW_WATERMARK = 128 * 1024
+TERMINAL_SCROLLBACK_BYTES = 256 * 1024
+
+
+class TerminalSession:
+    def __init__(self, token: str, sid: str):
+        self.token = token
+        self.sid: str | None = sid
+        self.chan: paramiko.Channel | None = None
+        self.cols = 80
+        self.rows = 24
+        self.created_at = time.time()
+        self.last_activity = self.created_at
+        self.detached_at: float | None = None
+        self.closed = False
+        self.unacked = 0
+        self.paused = 0  # times the pump stopped for backpressure
+        self._flow = threading.Event()
+        self._flow.set()
+        self._scrollback: deque[bytes] = deque()
+        self._scrollback_bytes = 0
+
+    def emit(self, data: bytes | str) -> None:
+        # Only the owning connection's room ever sees this session's output. Status
+        # lines go out as bytes too, so every frame the browser acks was counted here.
+        frame = data.encode('utf-8') if isinstance(data, str) else data
+        if self.sid is not None:
+            self.unacked += len(frame)
+            socketio.emit('output', frame, namespace='/ssh', to=self.sid)
+
+    def _remember(self, frame: bytes) -> None:
+        self._scrollback.append(frame)
+        self._scrollback_bytes += len(frame)
+        while self._scrollback_bytes > TERMINAL_SCROLLBACK_BYTES and len(self._scrollback) > 1:
+            self._scrollback_bytes -= len(self._scrollback.popleft())
+        if self._scrollback_bytes > TERMINAL_SCROLLBACK_BYTES:  # one oversized frame: keep its tail
+            self._scrollback[0] = self._scrollback[0][-TERMINAL_SCROLLBACK_BYTES:]
+            self._scrollback_bytes = len(self._scrollback[0])
+
+    def _update_flow(self) -> None:
+        if self.closed:
+            self._flow.set()  # let the pump notice and exit
+        elif self.sid is None or self.unacked > TERMINAL_HIGH_WATERMARK:
+            if self._flow.is_set():
+                self.paused += 1
+            self._flow.clear()
+        elif self.unacked <= TERMINAL_LOW_WATERMARK:
+            self._flow.set()
+
+    def attach(self, sid: str) -> None:
+        replay = b"".join(self._scrollback)
+        # No yield between taking the snapshot and queueing the replay, so live frames
+        # can only follow it
+        self.sid = sid
+        self.detached_at = None
+        self.unacked = len(replay)
+        socketio.emit('session', self.token, namespace='/ssh', to=sid)
+        socketio.emit('replay', replay, namespace='/ssh', to=sid)
+        self._update_flow()
+
+    def detach(self) -> None:
+        self.sid = None
+        self.detached_at = time.time()
+        self._update_flow()
+
+    def ack(self, nbytes: int) -> None:
+        self.unacked = max(0, self.unacked - nbytes)
+        self._update_flow()
+
+    def send(self, data: str) -> None:
+        chan = self.chan
+        if chan is not None and not chan.closed:
+            self.last_activity = time.time()
+            chan.send(data)
+
+    def resize(self, cols: int, rows: int) -> None:
+        self.cols, self.rows = cols, rows
+        chan = self.chan
+        if chan is not None and not chan.closed:
+            chan.resize_pty(width=cols, height=rows)
+
+    def close(self) -> None:
+        self.closed = True
+        self._update_flow()
+        chan = self.chan
+        if chan is not None:
+            chan.close()  # wakes the pump's blocking recv(); the pool releases the slot
+
+    def run(self) -> None:
+        """Session green thread: open a shell on the pool, then pump until it ends."""
+        user = os.getenv('SSH_USER', 'root')
+        password = os.getenv('SSH_PASSWORD')
+        if not os.getenv('SSH_PRIVATE_KEY_B64') and not password:
+            self.emit("SSH_PASSWORD or SSH_PRIVATE_KEY_B64 not set. Terminal will not function.\r\n")
+            return
+        try:
+            with _ssh_pool.channel(TRUENAS_HOST, user, password, timeout=10) as chan:
+                chan.get_pty(term='xterm', width=self.cols, height=self.rows)
+                chan.invoke_shell()
+                self.chan = chan
+                if self.closed:  # client left while we were connecting
+                    return
+                _init_shell(chan)
+                self._pump(chan)
+                if not self.closed:
+                    self.emit("\r\n\x1b[33mSession ended.\x1b[0m\r\n")
+        except Exception as e:
+            app.logger.warning(f"Terminal session {self.token[:8]} failed: {e}")
+            self.emit(f"\r\n\x1b[31mSSH Connection Failed: {e}\x1b[0m\r\n")
+        finally:
+            self.chan = None
+            _terminals.discard(self)
+
+    def _pump(self, chan: paramiko.Channel) -> None:
+        frame_interval = 1.0 / TERMINAL_MAX_FPS
+        last_emit = 0.0
+        while not chan.closed:
+            # Backpressure: while the browser lags (or nobody is attached) leave the
+            # data in the channel; its window fills and the remote side blocks
+            self._flow.wait()
+            if self.closed:
+                break
+            # Blocks only this green thread until output (or EOF) arrives
+            data = chan.recv(TERMINAL_READ_BYTES)
+            if not data:
+                break
+            # Wait for the next frame slot; whatever arrives meanwhile joins this frame
+            wait = last_emit + frame_interval - time.time()
+            if wait > 0:
+                socketio.sleep(wait)
+            frame = bytearray(data)
+            while len(frame) < TERMINAL_MAX_FRAME and chan.recv_ready():
+                frame += chan.recv(TERMINAL_MAX_FRAME - len(frame))
+            frame = bytes(frame)
+            self._remember(frame)
+            self.emit(frame)
+            self._update_flow()
+            last_emit = self.last_activity = time.time()
+
+
+class TerminalManager:
+    def __init__(self, max_sessions: int, idle_timeout: float, detach_grace: float):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.detach_grace = detach_grace
+        self._sessions: dict[str, TerminalSession] = {}  # token -> session
+        self._by_sid: dict[str, str] = {}  # Socket.IO sid -> token
+        self._reaper_started = False
+        self.opened = 0
+        self.reattached = 0
+        self.rejected = 0
+        self.idle_closed = 0
+
+    def attach(self, sid: str, token: str | None) -> TerminalSession:
+        """Reattach the detached session `token` to `sid`, or open a new one."""
+        session = self._sessions.get(token) if token else None
+        if session is not None and session.sid is None and not session.closed:
+            self.reattached += 1
+        else:
+            if len(self._sessions) >= self.max_sessions:
+                self.rejected += 1
+                raise ConnectionRefusedError(f"Too many terminal sessions (max {self.max_sessions})")
+            session = TerminalSession(secrets.token_urlsafe(16), sid)
+            self._sessions[session.token] = session
+            self.opened += 1
+            socketio.start_background_task(session.run)
+            self._start_reaper()
+        self._by_sid[sid] = session.token
+        session.attach(sid)
+        return session
+
+    def get(self, sid: str) -> TerminalSession | None:
+        token = self._by_sid.get(sid)
+        return self._sessions.get(token) if token else None
+
+    def detach(self, sid: str) -> None:
+        session = self._sessions.get(self._by_sid.pop(sid, None) or "")
+        if session is not None and session.sid == sid:
+            session.detach()
+
+    def close(self, token: str) -> None:
+        session = self._sessions.pop(token, None)
+        if session is not None:
+            if session.sid is not None:
+                self._by_sid.pop(session.sid, None)
+            session.close()
+
+    def discard(self, session: TerminalSession) -> None:
+        if self._sessions.get(session.token) is session:
+            del self._sessions[session.token]
+
+    def _start_reaper(self) -> None:
+        if self._reaper_started:
+            return
+        self._reaper_started = True
+        socketio.start_background_task(target=self._reap)
+
+    def _reap(self) -> None:
+        while True:
+            socketio.sleep(min(30.0, self.idle_timeout / 4, self.detach_grace / 4))
+            now = time.time()
+            for session in list(self._sessions.values()):
+                if session.detached_at is not None and now - session.detached_at > self.detach_grace:
+                    self.close(session.token)
+                elif now - session.last_activity > self.idle_timeout:
+                    self.idle_closed += 1
+                    sid = session.sid
+                    session.emit("\r\n\x1b[33mSession closed after inactivity.\x1b[0m\r\n")
+                    self.close(session.token)
+                    if sid is not None:
+                        socketio.server.disconnect(sid, namespace='/ssh')
+
+    def stats(self) -> dict:
+        now = time.time()
+        sessions = list(self._sessions.values())
+        return {
+            "sessions": len(sessions),
+            "detached": sum(1 for s in sessions if s.sid is None),
+            "max_sessions": self.max_sessions,
+            "opened": self.opened,
+            "reattached": self.reattached,
+            "rejected": self.rejected,
+            "idle_closed": self.idle_closed,
+            "paused": sum(1 for s in sessions if not s._flow.is_set()),
+            "unacked_bytes": sum(s.unacked for s in sessions),
+            "scrollback_bytes": sum(s._scrollback_bytes for s in sessions),
+            "oldest_age": round(max((now - s.created_at for s in sessions), default=0.0), 1),
+        }
+
+
+_terminals = TerminalManager(TERMINAL_MAX_SESSIONS, TERMINAL_IDLE_TIMEOUT, TERMINAL_DETACH_GRACE)
+
+
+@socketio.on('connect', namespace='/ssh')
+def connect_ssh(auth=None):
+    """Client connected via WebSocket: reattach its shell or open a new one"""
+    from flask import request as flask_request
+    token = auth.get("session") if isinstance(auth, dict) else None
+    # Raising ConnectionRefusedError rejects the connection with a message for the client
+    _terminals.attach(flask_request.sid, token)
+
+
+@socketio.on('disconnect', namespace='/ssh')
+def disconnect_ssh():
+    from flask import request as flask_request
+    _terminals.detach(flask_request.sid)
+
+
+@socketio.on('ack', namespace='/ssh')
+def handle_ssh_ack(nbytes):
+    """Browser finished rendering `nbytes` of output"""
+    from flask import request as flask_request
+    session = _terminals.get(flask_request.sid)
+    if session is not None and isinstance(nbytes, int):
+        session.ack(nbytes)
+
 
 @socketio.on('input', namespace='/ssh')
 def handle_ssh_input(data):
     """Forward input to SSH"""
-    global ssh_channel
-    if ssh_channel and not ssh_channel.closed:
+    from flask import request as flask_request
+    session = _terminals.get(flask_request.sid)
+    if session is not None:
         try:
-            ssh_channel.send(data)
+            session.send(data)
         except Exception as e:
-            print(f"Error sending to SSH: {e}")
+            app.logger.warning(f"Error sending to SSH: {e}")
+
 
 @socketio.on('resize', namespace='/ssh')
 def handle_ssh_resize(data):
     """Resize terminal"""
-    global ssh_channel
-    if ssh_channel and not ssh_channel.closed:
+    from flask import request as flask_request
+    session = _terminals.get(flask_request.sid)
+    if session is not None:
         try:
-            ssh_channel.resize_pty(width=data['cols'], height=data['rows'])
+            session.resize(int(data['cols']), int(data['rows']))
         except Exception as e:
-            print(f"Error resizing SSH pty: {e}")
+            app.logger.warning(f"Error resizing SSH pty: {e}")
 
-def start_ssh_listener():
-    """Background thread to read from SSH and emit to SocketIO"""
-    global ssh_channel
-    print("SSH Listener Started")
-    
-    while ssh_channel and not ssh_channel.closed:
-        try:
-            if ssh_channel.recv_ready():
-                data = ssh_channel.recv(1024).decode('utf-8', errors='ignore')
-                socketio.emit('output', data, namespace='/ssh')
-            else:
-                socketio.sleep(0.01)
-        except Exception as e:
-            print(f"SSH Read Error: {e}")
-            break
 
-def init_ssh_connection():
-    global ssh_client, ssh_channel
-    
-    host = TRUENAS_HOST
-    user = os.getenv('SSH_USER', 'root')
-    
-    # 讀取並解碼私鑰
-    b64_key = os.getenv('SSH_PRIVATE_KEY_B64')
-    password = os.getenv('SSH_PASSWORD')
-    
-    try:
-        ssh_client = paramiko.SSHClient()
-        ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        # 關鍵修改：從字串載入私鑰
-        if b64_key:
-            # 1. 解碼 Base64 回原本的 PEM/OpenSSH 格式
-            key_str = base64.b64decode(b64_key).decode('utf-8')
-            # 2. 轉換成 Paramiko 認得的 Key 物件
-            # 嘗試檢測 Key 類型，預設嘗試 Ed25519，失敗則 RSA
-            try:
-                private_key = paramiko.Ed25519Key.from_private_key(io.StringIO(key_str))
-            except:
-                try:
-                    private_key = paramiko.RSAKey.from_private_key(io.StringIO(key_str))
-                except Exception as key_err:
-                     print(f"Failed to load private key: {key_err}")
-                     return
-
-            # 3. 使用 pkey 參數連線
-            print(f"Connecting with Private Key...")
-            ssh_client.connect(host, username=user, pkey=private_key)
-        else:
-            if not password:
-                print("SSH_PASSWORD or SSH_PRIVATE_KEY_B64 not set. Terminal will not function.")
-                return
-            # Fallback: 如果沒設 Key，試著用密碼
-            print(f"Connecting with Password...")
-            ssh_client.connect(host, username=user, password=password)
+def _init_shell(chan: paramiko.Channel) -> None:
+    # 延遲一點點時間讓 Shell 準備好
+    socketio.sleep(0.5)
 
-        
-        ssh_channel = ssh_client.invoke_shell(term='xterm')
-        
-        # 延遲一點點時間讓 Shell 準備好
-        socketio.sleep(0.5)
-
-        # 傳送 Enter 喚醒 Shell，避免初始卡頓
-        ssh_channel.send('\n')
-
-        # Prompt 設定：
-        # 1. 亮綠色 (%F{10}) User@Host
-        # 2. 分隔符號保留 ":" (User 請求)
-        # 3. 淺藍色 (%F{14}) Path，並透過變數替換確保 "/mnt" 顯示為 "~/mnt"
-        # 需啟用 prompt_subst
-        ssh_channel.send("setopt prompt_subst\n")
-        
-        # 複雜的 Zsh 變數替換邏輯：
-        # ${PWD/#$HOME/~} -> 把開頭的 Home 路徑換成 ~
-        # ${ ... /#\//~/ } -> 如果結果開頭還是 / (絕對路徑)，把 / 換成 ~/
-        prompt_style = r"'%F{10}%n@%m%f:%F{14}${${PWD/#$HOME/~}/#\//~/}%f %# '"
-        
-        # 設定當前使用者的 Prompt
-        ssh_channel.send(f"export PS1={prompt_style}\n")
-        
-        # 注入 sudo wrapper 函式
-        # 使用 env 傳遞 PS1 並加入 -o prompt_subst
-        sudo_wrapper = f"""
+    # 傳送 Enter 喚醒 Shell，避免初始卡頓
+    chan.send('\n')
+
+    # Prompt 設定：
+    # 1. 亮綠色 (%F{10}) User@Host
+    # 2. 分隔符號保留 ":" (User 請求)
+    # 3. 淺藍色 (%F{14}) Path，並透過變數替換確保 "/mnt" 顯示為 "~/mnt"
+    # 需啟用 prompt_subst
+    chan.send("setopt prompt_subst\n")
+
+    # 複雜的 Zsh 變數替換邏輯：
+    # ${PWD/#$HOME/~} -> 把開頭的 Home 路徑換成 ~
+    # ${ ... /#\//~/ } -> 如果結果開頭還是 / (絕對路徑)，把 / 換成 ~/
+    prompt_style = r"'%F{10}%n@%m%f:%F{14}${${PWD/#$HOME/~}/#\//~/}%f %# '"
+
+    # 設定當前使用者的 Prompt
+    chan.send(f"export PS1={prompt_style}\n")
+
+    # 注入 sudo wrapper 函式
+    # 使用 env 傳遞 PS1 並加入 -o prompt_subst
+    sudo_wrapper = f"""
 sudo() {{
     if [ "$1" = "-i" ]; then
         command sudo -i env PS1={prompt_style} zsh --no-rcs -o prompt_subst
@@ -1012,19 +3586,9 @@ sudo() {{
     fi
 }}
 """
-        ssh_channel.send(sudo_wrapper)
-        ssh_channel.send("export TERM=xterm-256color\n")
-        ssh_channel.send("clear\n")
-
-        socketio.start_background_task(target=start_ssh_listener)
-        
-        print("SSH Connection Established")
-    except Exception as e:
-        print(f"SSH Connection Failed: {e}")
-
-# Attempt to connect on startup
-init_ssh_connection()
-
+    chan.send(sudo_wrapper)
+    chan.send("export TERM=xterm-256color\n")
+    chan.send("clear\n")
 
 
 def _parse_smartctl_json(sj: dict, disk_name: str) -> dict:
@@ -1199,40 +3763,310 @@ def _shlex_quote(s: str) -> str:
 
 
 def _ssh_exec(cmd: str, timeout: int = 30, user: str | None = None, password: str | None = None, sudo_password: str | None = None) -> tuple[str, str]:
-    """Open a fresh exec channel via SSH and return (stdout, stderr).
+    """Run cmd on a new exec channel of a pooled SSH transport and return (stdout, stderr).
     If sudo_password is provided, it will be written to stdin for sudo -S.
     """
-    host = TRUENAS_HOST
     _user = user or os.getenv('SSH_USER', 'root')
     _password = password or os.getenv('SSH_PASSWORD')
-    b64_key = os.getenv('SSH_PRIVATE_KEY_B64')
+    if _upstream_replay is not None:
+        return _upstream_replay.ssh(cmd)
+
+    started = time.perf_counter()
+    with _upstream_seconds.time("ssh", _ssh_command_label(cmd)), \
+            _ssh_pool.channel(TRUENAS_HOST, _user, _password, timeout=timeout, judge_output=True) as chan:
+        chan.settimeout(timeout)
+        chan.exec_command(cmd)
+        if sudo_password:
+            chan.sendall((sudo_password + '\n').encode('utf-8'))
+            chan.shutdown_write()
+        out = chan.makefile('rb').read().decode('utf-8', errors='replace')
+        err = chan.makefile_stderr('rb').read().decode('utf-8', errors='replace')
+    if _upstream_recorder is not None:
+        _upstream_recorder.ssh(cmd, out, err, time.perf_counter() - started)
+    return out, err
+
+
+# Check for auth failure in output
+def _sudo_auth_failed(out: str) -> bool:
+    lower = out.lower()
+    return "incorrect password" in lower or "authentication failure" in lower or \
+           ("sudo:" in lower and "password is required" in lower and "incorrect" in lower)
+
+
+def _smart_json_useful(sj: dict) -> bool:
+    """Return True if the JSON blob contains meaningful SMART data."""
+    if not sj:
+        return False
+    # smartctl exit_status: bit 1 set means "device not supported"
+    exit_status = (sj.get("smartctl") or {}).get("exit_status", 0)
+    if exit_status & 0x02:  # bit 1 = device open failed / unsupported
+        return False
+    ss = sj.get("smart_status") or {}
+    has_status  = "passed" in ss
+    has_attrs   = bool((sj.get("ata_smart_attributes") or {}).get("table"))
+    has_nvme    = bool(sj.get("nvme_smart_health_information_log"))
+    has_support = (sj.get("smart_support") or {}).get("available", True)
+    return has_support and (has_status or has_attrs or has_nvme)
+
+
+# --- Batched smartctl ---
+# One remote script over a single exec channel runs smartctl for every disk,
+# trying each candidate -d type until smartctl can open the device, and prints
+# one "<disk>\t<dtype>\t<compact json>" line per disk as soon as it is done.
+# The loop itself runs unprivileged; only the smartctl calls go through sudo, so a
+# smartctl-only sudoers rule is enough. The sudo password (if any) is the first
+# line of stdin and is checked once up front so a wrong one fails a single time.
+
+SMARTCTL_DEVICE_TYPES = ("", "sat", "sat,auto")
+_DISK_NAME_RE = re.compile(r"[A-Za-z0-9_.-]+")
+
+_SMARTCTL_BATCH_FN = r"""IFS= read -r SUDO_PW
+if [ -n "$SUDO_PW" ]; then printf '%s\n' "$SUDO_PW" | sudo -S -p '' -v || exit 1; fi
+run_smartctl() {
+  if [ -n "$SUDO_PW" ]; then printf '%s\n' "$SUDO_PW" | sudo -S -p '' smartctl "$@"
+  else sudo -n smartctl "$@"; fi
+}
+probe() {
+  dev=$1; shift
+  for d in "$@"; do
+    if [ "$d" = "-" ]; then out=$(run_smartctl --json=c $SMART_ARGS "/dev/$dev"); rc=$?
+    else out=$(run_smartctl -d "$d" --json=c $SMART_ARGS "/dev/$dev"); rc=$?; fi
+    [ $((rc & 3)) -eq 0 ] && break
+  done
+  printf '%s\t%s\t%s\n' "$dev" "$d" "$(printf '%s' "$out" | tr -d '\n')"
+}
+"""
 
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+def _parse_smartctl_batch_line(line: str) -> tuple[str, str, dict | None] | None:
+    """One "name<TAB>dtype<TAB>json" line of batch output -> (name, dtype, smartctl_json)."""
+    name, _, rest = line.partition('\t')
+    dtype, _, payload = rest.partition('\t')
+    if not name:
+        return None
+    dtype = "" if dtype == "-" else dtype
     try:
-        if b64_key:
-            key_str = base64.b64decode(b64_key).decode('utf-8')
-            try:
-                pkey = paramiko.Ed25519Key.from_private_key(io.StringIO(key_str))
-            except Exception:
-                pkey = paramiko.RSAKey.from_private_key(io.StringIO(key_str))
-            client.connect(host, username=_user, pkey=pkey, timeout=10)
-        else:
-            client.connect(host, username=_user, password=_password, timeout=10)
+        sj = json.loads(payload) if payload.strip() else None
+    except ValueError:
+        app.logger.debug(f"smartctl batch: unparsable output for {name}")
+        sj = None
+    return name, dtype, sj
+
+
+def _build_smartctl_batch_script(disks: list[tuple[str, tuple[str, ...]]], smart_args: str) -> str:
+    lines = [f"SMART_ARGS={_shlex_quote(smart_args)}", _SMARTCTL_BATCH_FN]
+    for name, dtypes in disks:
+        candidates = " ".join(_shlex_quote(d or "-") for d in (dtypes or ("",)))
+        lines.append(f"probe {_shlex_quote(name)} {candidates}")
+    return "\n".join(lines)
+
+
+def _smartctl_batch(
+    disks: list[tuple[str, tuple[str, ...]]],
+    smart_args: str = "-a",
+    timeout: int = 60,
+    user: str | None = None,
+    password: str | None = None,
+    sudo_password: str | None = None,
+) -> Iterator[tuple[str, str, dict | None]]:
+    """Yield (disk_name, device_type, smartctl_json) per disk as results stream in.
+
+    `disks` is a list of (name, candidate -d types); "" means smartctl's default.
+    Raises PermissionError when sudo rejects the password.
+    """
+    for name, _ in disks:
+        if not _DISK_NAME_RE.fullmatch(name):
+            raise ValueError(f"Invalid disk name: {name!r}")
+    if not disks:
+        return
+
+    script = _build_smartctl_batch_script(disks, smart_args)
+    cmd = f"sh -c {_shlex_quote(script)}"
+    _user = user or os.getenv('SSH_USER', 'root')
+    _password = password or os.getenv('SSH_PASSWORD')
 
-        stdin, stdout, stderr = client.exec_command(cmd, timeout=timeout)
-        if sudo_password:
-            stdin.write(sudo_password + '\n')
-            stdin.flush()
-            stdin.channel.shutdown_write()
-        out = stdout.read().decode('utf-8', errors='replace')
-        err = stderr.read().decode('utf-8', errors='replace')
-        return out, err
+    if _upstream_replay is not None:
+        out, err = _upstream_replay.ssh(cmd)
+        for line in out.splitlines():
+            parsed = _parse_smartctl_batch_line(line)
+            if parsed:
+                yield parsed
+        if _sudo_auth_failed(err):
+            raise PermissionError("sudo authentication failed")
+        return
+
+    started = time.perf_counter()
+    captured = []
+    err = ""
+    executed = False
+    try:
+        with _upstream_seconds.time("ssh", "smartctl_batch"), \
+                _ssh_pool.channel(TRUENAS_HOST, _user, _password, timeout=timeout, judge_output=True) as chan:
+            chan.settimeout(timeout)
+            chan.exec_command(cmd)
+            executed = True
+            # the script reads one line for the sudo password; EOF means sudo -n
+            if sudo_password:
+                chan.sendall((sudo_password + '\n').encode('utf-8'))
+            chan.shutdown_write()
+            for raw in chan.makefile('rb'):
+                line = raw.decode('utf-8', errors='replace').rstrip('\n')
+                if _upstream_recorder is not None:
+                    captured.append(line)
+                parsed = _parse_smartctl_batch_line(line)
+                if parsed:
+                    yield parsed
+            err = chan.makefile_stderr('rb').read().decode('utf-8', errors='replace')
+            if _sudo_auth_failed(err):
+                raise PermissionError("sudo authentication failed")
     finally:
+        # also when the consumer stops early or a read fails: keep what was seen
+        if _upstream_recorder is not None and executed:
+            _upstream_recorder.ssh(cmd, "\n".join(captured), err, time.perf_counter() - started)
+
+
+# --- smartctl Device Type Memory ---
+# Disk serial -> the -d type that produced usable smartctl output ("" = default),
+# learned on first success and persisted so later calls skip the probing. The
+# remembered type is tried first; if it stops working the remaining candidates
+# are probed again and the map is updated.
+
+SMARTCTL_DEVICE_TYPES_FILE = data_dir / "smartctl_device_types.json"
+
+_smartctl_dtypes_lock = threading.Lock()
+
+
+def _load_smartctl_dtypes() -> dict[str, str]:
+    try:
+        data = json.loads(SMARTCTL_DEVICE_TYPES_FILE.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        app.logger.warning(f"Ignoring unreadable {SMARTCTL_DEVICE_TYPES_FILE.name}: {e}")
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {str(k): str(v) for k, v in data.items()}
+
+
+_smartctl_dtypes: dict[str, str] = _load_smartctl_dtypes()
+
+
+def _remember_smartctl_dtype(serial: str, dtype: str) -> None:
+    if not serial:
+        return
+    with _smartctl_dtypes_lock:
+        if _smartctl_dtypes.get(serial) == dtype:
+            return
+        _smartctl_dtypes[serial] = dtype
+        snapshot = dict(_smartctl_dtypes)
+    app.logger.info(f"smartctl: remembering -d {dtype or '(default)'} for serial {serial}")
+    tmp = SMARTCTL_DEVICE_TYPES_FILE.with_suffix(".tmp")
+    try:
+        tmp.write_text(json.dumps(snapshot, indent=1, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, SMARTCTL_DEVICE_TYPES_FILE)
+    except OSError as e:
+        app.logger.warning(f"Could not save {SMARTCTL_DEVICE_TYPES_FILE.name}: {e}")
+
+
+def _smartctl_dtype_candidates(serial: str, defaults: tuple[str, ...] = SMARTCTL_DEVICE_TYPES) -> tuple[str, ...]:
+    """Candidate -d types for a disk, with the remembered one (if any) first."""
+    known = _smartctl_dtypes.get(serial) if serial else None
+    if known is None:
+        return tuple(defaults)
+    return (known,) + tuple(d for d in defaults if d != known)
+
+
+# --- SMART Cache ---
+# Parsed smartctl results keyed by disk serial. A background job keeps entries
+# younger than SMART_CACHE_TTL with batched smartctl runs (at most
+# SMART_REFRESH_CONCURRENCY execs at once, and "-n standby" so sleeping drives
+# are skipped instead of spun up). /api/smart/<disk> answers from memory unless
+# ?refresh=1 is given.
+
+SMART_CACHE_TTL = 1800
+SMART_REFRESH_INTERVAL = 60
+SMART_REFRESH_CONCURRENCY = 2
+SMART_REFRESH_BATCH = 4
+
+_smart_cache = TTLCache(max_entries=128, max_bytes=4 * 1024 * 1024)
+_smart_refresher_started = False
+
+
+def _disk_serials() -> dict[str, str]:
+    """Map disk name -> serial from the (cached) TrueNAS disk list."""
+    try:
+        disks = _fetch_truenas_cached("/api/v2.0/disk", params={"limit": 0})
+    except Exception as e:
+        app.logger.debug(f"Disk list unavailable for SMART cache: {e}")
+        return {}
+    if not isinstance(disks, list):
+        return {}
+    return {d["name"]: d.get("serial") or "" for d in disks if d.get("name")}
+
+
+def _smart_cache_store(serial: str, parsed: dict) -> None:
+    if serial:
+        parsed["read_at"] = time.time()
+        _smart_cache.put(serial, parsed, SMART_CACHE_TTL)
+        if parsed.get("temp") is not None and parsed.get("disk"):
+            _record_sample(f"disk.{os.path.basename(parsed['disk'])}.temp", parsed["read_at"], parsed["temp"])
+
+
+def _refresh_smart_chunk(names: list[str], serials: dict[str, str]) -> None:
+    try:
+        for name, dtype, sj in _smartctl_batch(
+            [(n, _smartctl_dtype_candidates(serials.get(n, ""))) for n in names],
+            smart_args="-n standby,0 -a",
+            timeout=120,
+        ):
+            if not _smart_json_useful(sj):
+                continue  # asleep or unsupported: keep the previous entry
+            serial = serials.get(name, "")
+            _remember_smartctl_dtype(serial, dtype)
+            parsed = _parse_smartctl_json(sj, name)
+            if dtype:
+                parsed["device_type_hint"] = dtype
+            _smart_cache_store(serial, parsed)
+    except Exception as e:
+        app.logger.warning(f"SMART background refresh failed for {', '.join(names)}: {e}")
+
+
+def _refresh_smart_cache() -> None:
+    serials = _disk_serials()
+    due = []
+    for name, serial in serials.items():
+        if not serial:
+            continue
+        age = _smart_cache.age(serial)
+        if age is None or age > SMART_CACHE_TTL / 2:
+            due.append(name)
+    if not due:
+        return
+    pool = eventlet.GreenPool(SMART_REFRESH_CONCURRENCY)
+    for i in range(0, len(due), SMART_REFRESH_BATCH):
+        pool.spawn_n(_refresh_smart_chunk, due[i:i + SMART_REFRESH_BATCH], serials)
+    pool.waitall()
+
+
+def _smart_refresher() -> None:
+    while True:
         try:
-            client.close()
-        except Exception:
-            pass
+            _refresh_smart_cache()
+        except Exception as e:
+            app.logger.warning(f"SMART refresher error: {e}")
+        socketio.sleep(SMART_REFRESH_INTERVAL)
+
+
+def _start_smart_refresher() -> None:
+    """Fill the SMART cache at startup; needs SSH credentials from the environment."""
+    global _smart_refresher_started
+    if _smart_refresher_started or not TRUENAS_HOST:
+        return
+    if not (os.getenv("SSH_PRIVATE_KEY_B64") or os.getenv("SSH_PASSWORD")):
+        return
+    _smart_refresher_started = True
+    socketio.start_background_task(target=_smart_refresher)
 
 
 @app.route("/api/smart/<disk_name>")
@@ -1246,6 +4080,7 @@ def api_smart_disk(disk_name):
     # Allow caller to force a specific smartctl device type (e.g. "sat", "sat,auto", "usbcypress")
     # Useful for SATA-over-USB bridges that need explicit SAT passthrough.
     forced_device_type = flask_request.args.get("device_type", "").strip()
+    force_refresh = flask_request.args.get("refresh", "").strip() in {"1", "true", "yes"}
 
     try:
         if not disk_name.startswith("/dev/"):
@@ -1253,6 +4088,12 @@ def api_smart_disk(disk_name):
         else:
             dev_path = disk_name
 
+        serial = _disk_serials().get(dev_path[len("/dev/"):], "")
+        if serial and not force_refresh and not forced_device_type:
+            cached = _smart_cache.peek(serial, SMART_CACHE_TTL)
+            if cached is not None:
+                return jsonify(cached)
+
         def run_smart(args_suffix: str) -> tuple[str, str]:
             if ssh_pass:
                 # Use sudo -S -p '' to read password from stdin (no prompt output)
@@ -1262,48 +4103,30 @@ def api_smart_disk(disk_name):
                 cmd = f"sudo smartctl {args_suffix} {dev_path}"
                 return _ssh_exec(cmd, timeout=30, user=ssh_user)
 
-        # Check for auth failure in output
-        def _auth_failed(out: str) -> bool:
-            lower = out.lower()
-            return "incorrect password" in lower or "authentication failure" in lower or \
-                   ("sudo:" in lower and "password is required" in lower and "incorrect" in lower)
-
-        def _smart_json_useful(sj: dict) -> bool:
-            """Return True if the JSON blob contains meaningful SMART data."""
-            if not sj:
-                return False
-            # smartctl exit_status: bit 1 set means "device not supported"
-            exit_status = (sj.get("smartctl") or {}).get("exit_status", 0)
-            if exit_status & 0x02:  # bit 1 = device open failed / unsupported
-                return False
-            ss = sj.get("smart_status") or {}
-            has_status  = "passed" in ss
-            has_attrs   = bool((sj.get("ata_smart_attributes") or {}).get("table"))
-            has_nvme    = bool(sj.get("nvme_smart_health_information_log"))
-            has_support = (sj.get("smart_support") or {}).get("available", True)
-            return has_support and (has_status or has_attrs or has_nvme)
-
         # Build list of device type attempts:
-        # If caller forced a type, try only that. Otherwise try default then common USB fallbacks.
+        # If caller forced a type, try only that. Otherwise try the remembered type,
+        # then default and common USB fallbacks.
         if forced_device_type:
             device_type_attempts = [forced_device_type]
         else:
             # "" = smartctl default, then SAT (covers most USB-SATA bridges)
-            device_type_attempts = ["", "sat", "sat,auto"]
+            device_type_attempts = list(_smartctl_dtype_candidates(serial))
 
         smart_json = None
+        used_dtype = ""
         for dtype in device_type_attempts:
             dtype_flag = f"-d {dtype} " if dtype else ""
             try:
                 out, err = run_smart(f"{dtype_flag}--json -a")
                 combined = out + err
-                if _auth_failed(combined):
+                if _sudo_auth_failed(combined):
                     return jsonify({"auth_failed": True, "disk": disk_name}), 200
                 if out.strip():
                     try:
                         candidate = _json.loads(out)
                         if _smart_json_useful(candidate):
                             smart_json = candidate
+                            used_dtype = dtype
                             if dtype:
                                 # Surface the device type used so the UI can show it
                                 app.logger.info(f"smartctl: used -d {dtype} for {dev_path}")
@@ -1319,11 +4142,11 @@ def api_smart_disk(disk_name):
         if smart_json:
             parsed = _parse_smartctl_json(smart_json, disk_name)
             # Annotate with the device type hint used (helps UI surface the workaround)
-            used_dtype = forced_device_type or next(
-                (d for d in device_type_attempts if d and _smart_json_useful(smart_json)), ""
-            )
             if used_dtype:
                 parsed["device_type_hint"] = used_dtype
+            if _smart_json_useful(smart_json):
+                _remember_smartctl_dtype(serial, used_dtype)
+                _smart_cache_store(serial, parsed)
             return jsonify(parsed)
 
         # Attempt: plain text (last resort)
@@ -1332,7 +4155,7 @@ def api_smart_disk(disk_name):
             try:
                 out, err = run_smart(f"{dtype_flag}-a")
                 combined = out + err
-                if _auth_failed(combined):
+                if _sudo_auth_failed(combined):
                     return jsonify({"auth_failed": True, "disk": disk_name}), 200
                 text_out = out or err or "No output from smartctl"
                 return jsonify({"disk": disk_name, "raw_text": text_out})
@@ -1346,6 +4169,48 @@ def api_smart_disk(disk_name):
         return jsonify({"error": str(exc), "disk": disk_name}), 500
 
 
+@app.route("/api/smart/batch")
+def api_smart_batch():
+    """SMART details for several disks (?disks=sda,sdb; default: all) in one SSH round trip."""
+    from flask import request as flask_request
+
+    ssh_user = flask_request.headers.get("X-SSH-User", "").strip() or os.getenv("SSH_USER", "root")
+    ssh_pass = flask_request.headers.get("X-SSH-Pass", "").strip()
+
+    names = [n.strip() for n in flask_request.args.get("disks", "").split(",") if n.strip()]
+    if not names:
+        names = [d["name"] for d in (_get_disk_info() or [])]
+    names = [n[len("/dev/"):] if n.startswith("/dev/") else n for n in names]
+    bad = [n for n in names if not _DISK_NAME_RE.fullmatch(n)]
+    if bad:
+        return jsonify({"error": f"Invalid disk name(s): {', '.join(bad)}"}), 400
+
+    serials = _disk_serials()
+    results: dict[str, dict] = {}
+    try:
+        for name, dtype, sj in _smartctl_batch(
+            [(n, _smartctl_dtype_candidates(serials.get(n, ""))) for n in names],
+            user=ssh_user,
+            password=ssh_pass or None,
+            sudo_password=ssh_pass or None,
+        ):
+            if not _smart_json_useful(sj):
+                results[name] = {"error": "smartctl returned no usable output", "disk": name}
+                continue
+            _remember_smartctl_dtype(serials.get(name, ""), dtype)
+            parsed = _parse_smartctl_json(sj, name)
+            if dtype:
+                parsed["device_type_hint"] = dtype
+            results[name] = parsed
+    except PermissionError:
+        return jsonify({"auth_failed": True}), 200
+    except Exception as exc:
+        app.logger.error(f"SMART batch API Error: {exc}")
+        return jsonify({"error": str(exc), "disks": results}), 502
+
+    return jsonify({"disks": results})
+
+
 @app.route("/api/smart")
 def api_smart():
     try:
@@ -1359,7 +4224,7 @@ def api_smart():
         # Try to get SMART test results (may not be available on all versions)
         smart_results: dict[str, dict] = {}
         try:
-            results = _fetch_truenas("/api/v2.0/smart/test/results")
+            results = _fetch_truenas_cached("/api/v2.0/smart/test/results")
             if isinstance(results, list):
                 for r in results:
                     disk_name = r.get("disk")
@@ -1402,6 +4267,472 @@ def api_smart():
         return jsonify({"error": str(exc)}), 500
 
 
+@app.route("/api/debug/stats")
+def api_debug_stats():
+    """Internal counters for checking that pooling and caching behave."""
+    return jsonify({
+        "http": {
+            "truenas": _session_pool_stats(_truenas_session),
+            "netdata": _session_pool_stats(_netdata_session),
+        },
+        "cache": {
+            "truenas": _truenas_cache_store.stats(),
+            "smart": _smart_cache.stats(),
+        },
+        "singleflight": _upstream_flight.stats(),
+        "ssh_pool": _ssh_pool.stats(),
+        "fanout": _fanout.stats(),
+        "gpu": _gpu_sampler.stats(),
+        "history": _history.stats(),
+        "store": _metrics_store.stats() if _metrics_store is not None else None,
+        "truenas_ws": _truenas_ws.stats() if _truenas_ws is not None else None,
+        "terminals": _terminals.stats(),
+        "responses": {**_response_stats, "compressed_cache": _compressed_cache.stats()},
+        "capture": _upstream_capture.stats() if _upstream_capture is not None else None,
+        "breakers": {name: breaker.stats() for name, breaker in _breakers.items()},
+    })
+
+
+# --- Profiling ---
+# Admin-only endpoints for finding CPU hot spots and memory growth in production.
+# Both are disabled unless ADMIN_TOKEN is set; callers pass it as a Bearer token.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "").strip()
+PROFILE_MAX_SECONDS = 60
+TRACEMALLOC_MAX_SNAPSHOTS = 4
+
+# The sampler must keep running while a green thread hogs the hub, so it lives on a
+# real OS thread. Every green thread runs on the hub's OS thread, so sampling that
+# thread's current frame shows whichever green thread is on the CPU ("cpu" mode);
+# "wall" mode also walks the frames of parked green threads to show where they wait.
+_real_threading = eventlet.patcher.original("threading")
+_real_time = eventlet.patcher.original("time")
+
+
+def _admin_denied():
+    """Return an error response unless the request carries ADMIN_TOKEN, else None."""
+    from flask import request as flask_request
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Profiling is disabled; set ADMIN_TOKEN to enable it"}), 404
+    supplied = flask_request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not secrets.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+
+def _collapse_stack(frame, limit: int = 128) -> str:
+    parts = []
+    while frame is not None and len(parts) < limit:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = _real_threading.Lock()
+        self.running = False
+        self.runs = 0
+
+    def _green_frames(self) -> list:
+        import greenlet
+        return [g.gr_frame for g in gc.get_objects()
+                if isinstance(g, greenlet.greenlet) and g.gr_frame is not None]
+
+    def _sample(self, seconds: float, interval: float, mode: str, counts: dict, meta: dict) -> None:
+        target = _hub_thread_id
+        me = _real_threading.get_ident()
+        deadline = _real_time.monotonic() + seconds
+        parked, parked_at = [], 0.0
+        while _real_time.monotonic() < deadline:
+            frames = sys._current_frames()
+            frame = frames.get(target)
+            if frame is not None:
+                stack = _collapse_stack(frame)
+                counts[stack] = counts.get(stack, 0) + 1
+                meta["samples"] += 1
+            if mode == "wall":
+                # gc.get_objects() is the expensive part; refresh the green thread list once a second
+                now = _real_time.monotonic()
+                if now - parked_at >= 1.0:
+                    parked, parked_at = self._green_frames(), now
+                for gframe in parked:
+                    stack = "[parked];" + _collapse_stack(gframe)
+                    counts[stack] = counts.get(stack, 0) + 1
+            for tid, tframe in frames.items():
+                if tid not in (target, me):
+                    stack = f"[thread {tid}];" + _collapse_stack(tframe)
+                    counts[stack] = counts.get(stack, 0) + 1
+            _real_time.sleep(interval)
+
+    def profile(self, seconds: float, interval: float, mode: str) -> tuple[dict, dict] | None:
+        """Sample for `seconds`; returns ({collapsed stack: count}, meta), or None if busy."""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            self.running = True
+            self.runs += 1
+            counts: dict[str, int] = {}
+            meta = {"samples": 0, "seconds": seconds, "interval_ms": interval * 1000, "mode": mode}
+            worker = _real_threading.Thread(
+                target=self._sample, args=(seconds, interval, mode, counts, meta),
+                name="sampling-profiler", daemon=True,
+            )
+            started = time.perf_counter()
+            worker.start()
+            # Yield to the hub while the OS thread samples, then join (it is about to exit).
+            while worker.is_alive():
+                socketio.sleep(0.05)
+            worker.join()
+            meta["elapsed"] = round(time.perf_counter() - started, 3)
+            return counts, meta
+        finally:
+            self.running = False
+            self._lock.release()
+
+
+_hub_thread_id = _real_threading.get_ident()
+_profiler = SamplingProfiler()
+_tracemalloc_snapshots: OrderedDict[int, tuple[float, tracemalloc.Snapshot]] = OrderedDict()
+_tracemalloc_seq = itertools.count(1)
+
+
+@app.route("/api/debug/profile")
+def api_debug_profile():
+    """Sample stacks for ?seconds= (default 10) and return them in collapsed-stack format.
+
+    The text output feeds straight into flamegraph.pl or speedscope; ?format=json
+    returns the same counts with sampling metadata.
+    """
+    from flask import request as flask_request
+    denied = _admin_denied()
+    if denied:
+        return denied
+    try:
+        seconds = min(float(flask_request.args.get("seconds", 10)), PROFILE_MAX_SECONDS)
+        interval = max(float(flask_request.args.get("interval_ms", 5)), 1.0) / 1000
+    except ValueError:
+        return jsonify({"error": "seconds and interval_ms must be numbers"}), 400
+    mode = flask_request.args.get("mode", "cpu")
+    if mode not in ("cpu", "wall") or seconds <= 0:
+        return jsonify({"error": "mode must be cpu or wall and seconds must be positive"}), 400
+
+    result = _profiler.profile(seconds, interval, mode)
+    if result is None:
+        return jsonify({"error": "A profile is already running"}), 409
+    counts, meta = result
+    ordered = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)
+    if flask_request.args.get("format") == "json":
+        return jsonify({**meta, "stacks": [{"stack": s, "count": c} for s, c in ordered]})
+    body = "".join(f"{stack} {count}\n" for stack, count in ordered)
+    return app.response_class(body, content_type="text/plain; charset=utf-8")
+
+
+def _tracemalloc_stat(stat) -> dict:
+    frame = stat.traceback[0]
+    entry = {
+        "where": f"{frame.filename}:{frame.lineno}",
+        "size": stat.size,
+        "count": stat.count,
+    }
+    if hasattr(stat, "size_diff"):
+        entry["size_diff"] = stat.size_diff
+        entry["count_diff"] = stat.count_diff
+    if len(stat.traceback) > 1:
+        entry["traceback"] = [f"{f.filename}:{f.lineno}" for f in stat.traceback]
+    return entry
+
+
+@app.route("/api/debug/tracemalloc", methods=["GET", "POST", "DELETE"])
+def api_debug_tracemalloc():
+    """POST takes a snapshot (starting tracemalloc first if needed) and diffs it
+    against ?base=<id>, or the previous snapshot; GET lists snapshots; DELETE stops
+    tracing and drops them.
+    """
+    from flask import request as flask_request
+    denied = _admin_denied()
+    if denied:
+        return denied
+
+    if flask_request.method == "DELETE":
+        tracemalloc.stop()
+        _tracemalloc_snapshots.clear()
+        return jsonify({"tracing": False})
+
+    if flask_request.method == "GET":
+        return jsonify({
+            "tracing": tracemalloc.is_tracing(),
+            "traced": tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else None,
+            "snapshots": [{"id": i, "timestamp": ts} for i, (ts, _) in _tracemalloc_snapshots.items()],
+        })
+
+    try:
+        frames = max(1, int(flask_request.args.get("frames", 1)))
+        limit = max(1, int(flask_request.args.get("limit", 25)))
+        base_id = int(flask_request.args["base"]) if "base" in flask_request.args else None
+    except ValueError:
+        return jsonify({"error": "frames, limit and base must be integers"}), 400
+    key = "traceback" if frames > 1 else flask_request.args.get("key", "lineno")
+    if key not in ("lineno", "filename", "traceback"):
+        return jsonify({"error": "key must be lineno, filename or traceback"}), 400
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        return jsonify({
+            "tracing": True,
+            "frames": frames,
+            "message": "tracemalloc started; POST again to take the first snapshot",
+        })
+
+    if base_id is not None and base_id not in _tracemalloc_snapshots:
+        return jsonify({"error": f"Unknown snapshot {base_id}"}), 404
+    base = _tracemalloc_snapshots[base_id][1] if base_id is not None else (
+        next(reversed(_tracemalloc_snapshots.values()))[1] if _tracemalloc_snapshots else None
+    )
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+    snap_id = next(_tracemalloc_seq)
+    _tracemalloc_snapshots[snap_id] = (time.time(), snapshot)
+    while len(_tracemalloc_snapshots) > TRACEMALLOC_MAX_SNAPSHOTS:
+        _tracemalloc_snapshots.popitem(last=False)
+
+    current, peak = tracemalloc.get_traced_memory()
+    stats = snapshot.compare_to(base, key) if base is not None else snapshot.statistics(key)
+    return jsonify({
+        "id": snap_id,
+        "base": base_id if base_id is not None else (snap_id - 1 if base is not None else None),
+        "traced_bytes": current,
+        "peak_bytes": peak,
+        "top": [_tracemalloc_stat(s) for s in stats[:limit]],
+        # sizes of the usual suspects, to line up with the allocation sites above
+        "caches": {
+            "truenas": _truenas_cache_store.stats()["bytes"],
+            "smart": _smart_cache.stats()["bytes"],
+            "compressed": _compressed_cache.stats()["bytes"],
+            "terminal_scrollback": _terminals.stats()["scrollback_bytes"],
+            "history": _history.stats()["bytes"],
+        },
+    })
+
+
+# --- Prometheus /metrics ---
+# Plain HTTP scrape endpoint (unrelated to the Socket.IO '/metrics' namespace). Request
+# latency and in-flight counts are tracked by the hooks below; everything else is read
+# from the existing stats() methods at scrape time.
+
+@app.before_request
+def _track_request_start():
+    from flask import g
+    g.request_started = time.perf_counter()
+    _http_in_flight.inc()
+
+
+@app.after_request
+def _track_request_status(response):
+    from flask import g
+    g.response_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def _track_request_end(exc):
+    from flask import g, request as flask_request
+    started = g.pop("request_started", None)
+    if started is None:
+        return
+    _http_in_flight.dec()
+    endpoint = flask_request.url_rule.rule if flask_request.url_rule else "unmatched"
+    status = g.pop("response_status", 500 if exc is not None else 0)
+    _http_seconds.observe(endpoint, flask_request.method, str(status), value=time.perf_counter() - started)
+
+
+def _prom_scrape_gauges() -> Iterator[str]:
+    def family(name: str, help_text: str, kind: str, labelnames: tuple, rows: list[tuple]) -> Iterator[str]:
+        yield f"# HELP {name} {help_text}"
+        yield f"# TYPE {name} {kind}"
+        for *labels, value in rows:
+            if value is not None:
+                yield f"{name}{_prom_labels(labelnames, tuple(labels))} {float(value)}"
+
+    caches = {
+        "truenas": _truenas_cache_store.stats(),
+        "smart": _smart_cache.stats(),
+        "compressed": _compressed_cache.stats(),
+    }
+    yield from family(
+        "truenas_dash_cache_requests_total", "Cache lookups by result.", "counter", ("cache", "result"),
+        [(c, r, s[k]) for c, s in caches.items() for r, k in (("hit", "hits"), ("miss", "misses"), ("stale", "stale"))],
+    )
+    yield from family(
+        "truenas_dash_cache_evictions_total", "Entries evicted to stay within cache limits.", "counter", ("cache",),
+        [(c, s["evictions"]) for c, s in caches.items()],
+    )
+    yield from family(
+        "truenas_dash_cache_entries", "Entries currently cached.", "gauge", ("cache",),
+        [(c, s["entries"]) for c, s in caches.items()] + [("net_stats", len(_net_stats_cache))],
+    )
+    yield from family(
+        "truenas_dash_cache_bytes", "Approximate bytes held by each cache.", "gauge", ("cache",),
+        [(c, s["bytes"]) for c, s in caches.items()],
+    )
+
+    flight = _upstream_flight.stats()
+    yield from family(
+        "truenas_dash_singleflight_calls_total", "Upstream calls executed vs. joined onto an in-flight call.",
+        "counter", ("result",), [("executed", flight["executed"]), ("shared", flight["shared"])],
+    )
+    yield from family(
+        "truenas_dash_upstream_in_flight", "Upstream calls currently running.", "gauge", (),
+        [(flight["in_flight"],)],
+    )
+
+    fanout = _fanout.stats()
+    yield from family(
+        "truenas_dash_fanout_tasks", "Fan-out pool tasks by state.", "gauge", ("state",),
+        [("running", fanout["running"]), ("waiting", fanout["waiting"])],
+    )
+    yield from family(
+        "truenas_dash_fanout_timeouts_total", "Fan-out tasks cancelled at their deadline.", "counter", (),
+        [(fanout["timeouts"],)],
+    )
+
+    ssh = _ssh_pool.stats()
+    terminals = _terminals.stats()
+    yield from family(
+        "truenas_dash_ssh_connections", "Pooled SSH transports.", "gauge", (), [(ssh["connections"],)],
+    )
+    yield from family(
+        "truenas_dash_ssh_channels_active", "Open channels (exec + terminals) on pooled transports.", "gauge", (),
+        [(ssh["active_channels"],)],
+    )
+    yield from family(
+        "truenas_dash_terminal_sessions", "Browser terminal sessions by state.", "gauge", ("state",),
+        [("attached", terminals["sessions"] - terminals["detached"]), ("detached", terminals["detached"]),
+         ("paused", terminals["paused"])],
+    )
+    yield from family(
+        "truenas_dash_terminal_unacked_bytes", "Terminal output sent but not yet acknowledged by browsers.",
+        "gauge", (), [(terminals["unacked_bytes"],)],
+    )
+
+    yield from family(
+        "truenas_dash_circuit_state", "1 for the current state of each upstream's circuit breaker.", "gauge",
+        ("upstream", "state"),
+        [(name, state, int(b.state == state)) for name, b in _breakers.items() for state in ("closed", "open", "half_open")],
+    )
+    yield from family(
+        "truenas_dash_circuit_timeout_seconds", "Current adaptive request timeout per upstream path.", "gauge",
+        ("upstream", "path"),
+        [(name, key, timeout) for name, b in _breakers.items() for key, timeout in b.timeouts().items()],
+    )
+    yield from family(
+        "truenas_dash_circuit_rejected_total", "Calls failed fast while a breaker was open.", "counter", ("upstream",),
+        [(name, b.rejected) for name, b in _breakers.items()],
+    )
+
+    snapshot = _metrics_snapshot
+    yield from family(
+        "truenas_dash_metrics_snapshot_age_seconds", "Age of the collector's latest snapshot.", "gauge", (),
+        [(time.time() - snapshot.timestamp if snapshot else None,)],
+    )
+    yield from family(
+        "truenas_dash_metrics_subscribers", "Socket.IO clients receiving live metrics.", "gauge", (),
+        [(_metrics_subscribers,)],
+    )
+    yield from family(
+        "truenas_dash_truenas_ws_connected", "1 while the TrueNAS WebSocket is connected.", "gauge", (),
+        [(int(_truenas_ws.connected) if _truenas_ws is not None else None,)],
+    )
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    lines = []
+    for metric in (_upstream_seconds, _http_seconds, _http_in_flight, _net_stats_cache_events):
+        lines.extend(_prom_family(metric))
+    lines.extend(_prom_scrape_gauges())
+    return app.response_class(
+        "\n".join(lines) + "\n",
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+# --- Conditional GET & Compression ---
+# Every 200 JSON response under /api/ gets a content-hash ETag (answered with 304 on a
+# matching If-None-Match) and, above COMPRESS_MIN_BYTES, brotli or gzip encoding.
+# Compressed bodies are cached by content hash, so identical snapshots served to many
+# clients are compressed once.
+try:
+    import brotli
+except ImportError:  # Optional dependency; gzip is always available
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVEL_GZIP = 6
+COMPRESS_LEVEL_BROTLI = 5
+COMPRESS_CACHE_TTL = 600
+
+_compressed_cache = TTLCache(128, 8 * 1024 * 1024)
+_response_stats = {"etags": 0, "not_modified": 0, "compressed": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESS_LEVEL_BROTLI)
+    return gzip.compress(body, compresslevel=COMPRESS_LEVEL_GZIP, mtime=0)
+
+
+@app.after_request
+def add_etag_and_compress(response):
+    from flask import request as flask_request
+
+    if (
+        not flask_request.path.startswith("/api/")
+        or flask_request.method != "GET"
+        or response.status_code != 200
+        or response.direct_passthrough
+        or response.mimetype != "application/json"
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    body = response.get_data()
+    digest = hashlib.blake2b(body, digest_size=12).hexdigest()
+    # Weak: the same entity is served identity, gzip or br encoded
+    response.set_etag(digest, weak=True)
+    response.headers["Cache-Control"] = "no-cache"
+    response.vary.add("Accept-Encoding")
+    _response_stats["etags"] += 1
+
+    if flask_request.if_none_match.contains_weak(digest):
+        _response_stats["not_modified"] += 1
+        response.status_code = 304
+        response.set_data(b"")
+        response.headers.pop("Content-Length", None)
+        return response
+
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    accepted = flask_request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        encoding = "br"
+    elif accepted["gzip"]:
+        encoding = "gzip"
+    else:
+        return response
+
+    compressed = _compressed_cache.get((digest, encoding), lambda: _compress(body, encoding), COMPRESS_CACHE_TTL)
+    _response_stats["compressed"] += 1
+    _response_stats["bytes_in"] += len(body)
+    _response_stats["bytes_out"] += len(compressed)
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
 @app.after_request
 def add_cors_headers(response):
     response.headers['Access-Control-Allow-Origin'] = '*'
@@ -1409,5 +4740,14 @@ def add_cors_headers(response):
     response.headers['Access-Control-Allow-Methods'] = 'GET,PUT,POST,DELETE,OPTIONS'
     return response
 
+# Start the shared metrics collector, the SMART cache refresher and the GPU sampler with the app
+_start_metrics_store()
+_start_truenas_ws()
+_start_metrics_collector()
+_start_smart_refresher()
+_gpu_sampler.start()
+
 if __name__ == "__main__":
-    socketio.run(app, host="0.0.0.0", port=5003, debug=True, allow_unsafe_werkzeug=True)
+    # No reloader: its watcher process imports this module too and would run every
+    # background poller (and open the metric store) a second time
+    socketio.run(app, host="0.0.0.0", port=5003, debug=True, use_reloader=False, allow_unsafe_werkzeug=True)
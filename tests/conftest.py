@@ -0,0 +1,50 @@
+"""Import app.py with every upstream unset, so its background pollers stay idle.
+
+Runs before any test module imports app; tests that need an upstream start one of
+the stand-in servers from tools/ and point a fresh client object at it.
+"""
+import os
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+TOOLS = ROOT / "tools"
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(TOOLS))
+
+# load_dotenv() leaves variables that are already set alone, even empty ones
+os.environ.update({
+    "TRUENAS_HOST": "",
+    "TRUENAS_API_KEY": "",
+    "NETDATA_URL": "",
+    "NETDATA_HOST": "",
+    "SSH_PASSWORD": "",
+    "SSH_PRIVATE_KEY_B64": "",
+    "TRUENAS_WS": "0",
+    "METRICS_STORE": "0",
+    "NVIDIA_SMI_BIN": "/nonexistent",
+    "UPSTREAM_RECORD": "",
+    "UPSTREAM_REPLAY": "",
+    "DATA_DIR": tempfile.mkdtemp(prefix="dash-tests-"),
+})
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(predicate, timeout: float = 10.0) -> bool:
+    """Poll predicate() while letting app.py's green threads run."""
+    import app
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        app.socketio.sleep(0.05)
+    return False
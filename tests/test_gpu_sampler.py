@@ -0,0 +1,46 @@
+import app
+
+from conftest import TOOLS, wait_for
+
+FAKE_SMI = str(TOOLS / "fake_nvidia_smi.py")
+
+
+def test_sampler_parses_fake_nvidia_smi_loop(monkeypatch):
+    monkeypatch.setattr(app, "GPU_SAMPLE_MS", 250)
+    sampler = app.GPUSampler(250, FAKE_SMI)
+    sampler.start()
+
+    # a process line can beat the first GPU line; it gets its GPU index next round
+    assert wait_for(lambda: [p["gpu_index"] for p in (sampler.snapshot() or {}).get("processes", [])] == [0, 1])
+    snapshot = sampler.snapshot()
+    assert sampler.backend == "nvidia-smi"
+    assert [g["index"] for g in snapshot["gpus"]] == [0, 1]
+    assert [g["uuid"] for g in snapshot["gpus"]] == ["GPU-fake-0000", "GPU-fake-0001"]
+    assert snapshot["gpus"][0]["name"] == "Fake Tesla P4"
+    assert snapshot["memory_total"] == 7680
+    assert 0 <= snapshot["utilization"] <= 100
+    assert 35 <= snapshot["temperature"] <= 80
+    assert sorted((p["gpu_index"], p["pid"]) for p in snapshot["processes"]) == [(0, 1000), (1, 1100)]
+    assert snapshot["processes"][0]["name"].startswith("/usr/bin/fake-worker-")
+
+
+def test_sampler_restarts_nvidia_smi_after_it_exits(monkeypatch):
+    monkeypatch.setenv("FAKE_GPU_ROUNDS", "1")
+    monkeypatch.setattr(app, "GPU_SAMPLE_MS", 250)
+    monkeypatch.setattr(app, "GPU_RESTART_DELAY", 0.2)
+    spawned = []
+    popen = app.subprocess.Popen
+
+    def counting_popen(cmd, *args, **kwargs):
+        spawned.append(cmd[1].split("=", 1)[0])
+        return popen(cmd, *args, **kwargs)
+
+    monkeypatch.setattr(app.subprocess, "Popen", counting_popen)
+    sampler = app.GPUSampler(250, FAKE_SMI)
+    sampler.start()
+
+    assert wait_for(lambda: spawned.count("--query-gpu") >= 3)
+    first_update = sampler._updated_at
+    assert wait_for(lambda: sampler._updated_at > first_update)
+    assert sampler.snapshot() is not None
+    assert sampler.stats()["gpus"] == 2
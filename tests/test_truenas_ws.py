@@ -0,0 +1,144 @@
+import socket
+import subprocess
+import sys
+
+import pytest
+
+import app
+import fake_upstreams
+
+from conftest import TOOLS, free_port, wait_for
+
+API_KEY = "test-key"
+
+
+@pytest.fixture
+def fake_ws():
+    """Start tools/fake_truenas_ws.py; returns (url, process)."""
+    procs = []
+
+    def start(*extra: str) -> tuple[str, subprocess.Popen]:
+        port = free_port()
+        proc = subprocess.Popen(
+            [sys.executable, str(TOOLS / "fake_truenas_ws.py"), "--port", str(port), "--api-key", API_KEY, *extra],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        procs.append(proc)
+
+        def listening() -> bool:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                return True
+            except OSError:
+                return False
+
+        assert wait_for(listening), "fake TrueNAS WebSocket server did not start"
+        return f"ws://127.0.0.1:{port}/api/current", proc
+
+    yield start
+    for proc in procs:
+        proc.kill()
+        proc.wait()
+
+
+def test_login_with_api_key(fake_ws):
+    url, _ = fake_ws()
+    client = app.TrueNASWebSocket(url, API_KEY)
+    client.start()
+
+    assert wait_for(lambda: client.connected)
+    info = client.call("system.info")
+    assert info["hostname"] == "fake-truenas"
+    assert info["stats"]["logins"] == 1
+
+
+def test_rejected_api_key_does_not_connect(fake_ws):
+    url, _ = fake_ws()
+    client = app.TrueNASWebSocket(url, "wrong-key")
+    client.start()
+
+    assert wait_for(lambda: client.errors > 0)
+    assert not client.connected
+    assert client.last_error == "PermissionError: API key rejected"
+
+
+def test_realtime_update_reaches_collector(fake_ws, monkeypatch):
+    monkeypatch.setattr(app, "_truenas_realtime", None)
+    url, _ = fake_ws("--interval", "0.2")
+    client = app.TrueNASWebSocket(url, API_KEY)
+    client.subscribe("reporting.realtime", app._on_realtime)
+    client.start()
+
+    assert wait_for(lambda: app._realtime_fields() is not None)
+    fields = app._realtime_fields()
+    assert 0 <= app._realtime_cpu_usage(fields) <= 100
+    assert app._realtime_memory(fields)["total"] == 64 * 1024
+    assert set(app._realtime_net(fields, "eno1")) == {"rx", "tx"}
+    assert app._realtime_disk_io(fields)["read_ops"] >= 0
+
+
+def test_collection_change_invalidates_rest_cache(fake_ws, monkeypatch):
+    cache = app.TTLCache(16, 1 << 20)
+    monkeypatch.setattr(app, "_truenas_cache_store", cache)
+    invalidated = []
+    invalidate = cache.invalidate
+
+    def spy(match):
+        dropped = invalidate(match)
+        invalidated.append(dropped)
+        return dropped
+
+    monkeypatch.setattr(cache, "invalidate", spy)
+    cache.put(("/api/v2.0/pool", None), [{"name": "storage"}], 3600)
+    cache.put(("/api/v2.0/system/info", None), {"hostname": "truenas"}, 3600)
+    url, _ = fake_ws("--interval", "0.2", "--change-every", "0.2")
+    client = app.TrueNASWebSocket(url, API_KEY)
+    client.subscribe("pool.query", app._on_inventory_change)
+    client.start()
+
+    assert wait_for(lambda: invalidated)
+    assert invalidated[0] == 1
+    assert cache.peek(("/api/v2.0/pool", None), 3600) is None
+    assert cache.peek(("/api/v2.0/system/info", None), 3600) == {"hostname": "truenas"}
+
+
+def test_rest_fallback_after_disconnect(fake_ws, monkeypatch):
+    upstream = fake_upstreams.FakeUpstream(latency_ms=0, jitter_ms=0)
+    truenas_port = free_port()
+    servers = fake_upstreams.serve(upstream, truenas_port, free_port())
+    monkeypatch.setattr(app, "TRUENAS_HOST", "127.0.0.1")
+    monkeypatch.setattr(app, "TRUENAS_PORT", str(truenas_port))
+    monkeypatch.setattr(app, "TRUENAS_SCHEME", "http")
+    monkeypatch.setattr(app, "TRUENAS_INTERFACE_NET1", "eno1")
+    monkeypatch.setattr(app, "TRUENAS_INTERFACE_NET2", "")
+    monkeypatch.setattr(app, "REALTIME_MAX_AGE", 0.5)
+    monkeypatch.setattr(app, "_truenas_realtime", None)
+    monkeypatch.setattr(app, "_net_stats_cache", {})
+    try:
+        url, proc = fake_ws("--interval", "0.1")
+        client = app.TrueNASWebSocket(url, API_KEY)
+        client.subscribe("reporting.realtime", app._on_realtime)
+        client.start()
+        assert wait_for(lambda: app._realtime_fields() is not None)
+
+        # connected: interface rates come from the pushed realtime numbers
+        # (app.py's own collector also ticks here, so counts start from now)
+        upstream.reset()
+        metrics = app._collect_metrics()
+        assert metrics["nets"] and metrics["disk_io"] is not None
+        assert upstream.stats()["requests"].get("POST /api/v2.0/reporting/get_data", 0) == 0
+
+        proc.kill()
+        proc.wait()
+        assert wait_for(lambda: not client.connected)
+        assert wait_for(lambda: app._realtime_fields() is None)
+
+        # disconnected and stale: back to polling reporting/get_data over REST
+        monkeypatch.setattr(app, "_net_stats_cache", {})
+        metrics = app._collect_metrics()
+        assert upstream.stats()["requests"]["POST /api/v2.0/reporting/get_data"] >= 1
+        assert metrics["nets"][0]["label"] == app.NETDATA_LABEL_NET1
+        assert metrics["disk_io"] is None
+    finally:
+        for server in servers:
+            server.shutdown()
@@ -0,0 +1,84 @@
+import signal
+import subprocess
+
+import requests
+
+import app
+import bench
+import fake_upstreams
+
+from conftest import free_port
+
+# One collector tick per run: the replay's first tick then reads the recording of the
+# recorded run's first tick, so both snapshots must come out identical.
+APP_ENV = {"METRICS_INTERVAL": "3600", "NETDATA_CHART_NET2": ""}
+
+
+def _metrics_from_app(truenas_port: int, netdata_port: int, data_dir: str, env: dict) -> tuple[dict, dict]:
+    """/api/metrics and the capture counters from one app.py run."""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    proc = bench.start_app(port, truenas_port, netdata_port, data_dir, {**APP_ENV, **env})
+    try:
+        bench.wait_ready(base_url, proc)
+        response = requests.get(f"{base_url}/api/metrics", timeout=10)
+        assert response.status_code == 200
+        capture = requests.get(f"{base_url}/api/debug/stats", timeout=10).json()["capture"]
+        return response.json(), capture
+    finally:
+        # SIGINT, not SIGTERM: atexit has to run so the recorder closes the gzip stream
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def test_replay_reproduces_recorded_metrics(tmp_path):
+    upstream = fake_upstreams.FakeUpstream(latency_ms=0, jitter_ms=0)
+    truenas_port, netdata_port = free_port(), free_port()
+    capture = tmp_path / "capture.jsonl.gz"
+    servers = fake_upstreams.serve(upstream, truenas_port, netdata_port)
+    try:
+        recorded, _ = _metrics_from_app(truenas_port, netdata_port, str(tmp_path / "record"),
+                                        {"UPSTREAM_RECORD": str(capture)})
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+    assert recorded["cpu_usage"] is not None
+    assert recorded["nets"] and recorded["disks"]
+
+    # The fake servers are gone: everything below has to come from the capture
+    replayed, stats = _metrics_from_app(truenas_port, netdata_port, str(tmp_path / "replay"),
+                                        {"UPSTREAM_REPLAY": str(capture), "UPSTREAM_REPLAY_SPEED": "0"})
+    assert replayed == recorded
+    assert stats["served"] > 0 and stats["misses"] == 0
+
+
+def _response(body: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Content-Type"] = "application/json"
+    response._content = body
+    return response
+
+
+def test_replay_matches_exact_then_loose_keys(tmp_path):
+    capture = tmp_path / "capture.jsonl.gz"
+    url = "http://nas/api/v2.0/pool/dataset?name=tank"
+    recorder = app.UpstreamRecorder(str(capture))
+    for n in (1, 2):
+        recorder.http("truenas", requests.Request("GET", url).prepare(), 0.01, _response(b"[%d]" % n))
+    recorder.close()
+
+    replay = app.UpstreamReplay(str(capture), speed=0)
+    get = lambda target: replay.http(requests.Request("GET", target).prepare())  # noqa: E731
+    # exact key: recordings are served in order, then cycle
+    assert [get(url).json() for _ in range(3)] == [[1], [2], [1]]
+    # another query on the same path only has the loose (path-only) key to go on
+    assert get("http://nas/api/v2.0/pool/dataset?name=other").json() == [1]
+    assert get("http://nas/api/v2.0/disk").status_code == 404
+    assert replay.stats()["served"] == 4
+    assert replay.stats()["misses"] == 1
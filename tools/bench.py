@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Load-test the dashboard against local stand-in TrueNAS and Netdata servers.
+
+Usage: python tools/bench.py [--clients 16] [--duration 15] [--warmup 5]
+                             [--endpoints /api/metrics,/api/stats,/api/smart]
+                             [--latency-ms 20] [--jitter-ms 10] [--failure-rate 0]
+                             [--out bench-<commit>.json] [--compare previous.json]
+
+Starts tools/fake_upstreams.py servers in-process and app.py in a subprocess
+pointed at them, then hits each endpoint in turn from --clients concurrent
+clients for --duration seconds. Upstream counters are reset between endpoints,
+so each result carries the TrueNAS/Netdata calls made while it ran (the
+background collector's calls included). Results are written as JSON; --compare
+prints throughput and latency changes against an earlier results file.
+
+SSH is not configured, so /api/smart measures the TrueNAS REST path only.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import fake_upstreams  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[idx]
+
+
+def _git_revision() -> str:
+    try:
+        out = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def start_app(port: int, truenas_port: int, netdata_port: int, data_dir: str, extra_env: dict) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "TRUENAS_HOST": "127.0.0.1",
+        "TRUENAS_PORT": str(truenas_port),
+        "TRUENAS_SCHEME": "http",
+        "TRUENAS_API_KEY": "bench",
+        "NETDATA_URL": f"http://127.0.0.1:{netdata_port}",
+        "NETDATA_HOST": "",
+        "NETDATA_CHART_CPU": "system.cpu",
+        "NETDATA_CHART_RAM": "system.ram",
+        "NETDATA_CHART_NET1": "net.eno1",
+        "NETDATA_CHART_NET2": "net.enp3s0",
+        "SSH_PASSWORD": "",
+        "SSH_PRIVATE_KEY_B64": "",
+        "TRUENAS_WS": "0",
+        "NVIDIA_SMI_BIN": "/nonexistent",
+        "DATA_DIR": data_dir,
+        **extra_env,
+    }
+    # app.py's __main__ block binds 0.0.0.0:5003 in debug mode, so start the server directly
+    code = (
+        "import app; "
+        f"app.socketio.run(app.app, host='127.0.0.1', port={port}, log_output=False, allow_unsafe_werkzeug=True)"
+    )
+    return subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"app.py exited with status {proc.returncode}")
+        try:
+            if requests.get(f"{base_url}/api/metrics", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError("app.py did not become ready")
+
+
+def run_endpoint(url: str, clients: int, duration: float) -> dict:
+    latencies: list[list[float]] = [[] for _ in range(clients)]
+    statuses: list[dict] = [{} for _ in range(clients)]
+    errors = [0] * clients
+    stop_at = time.monotonic() + duration
+
+    def client(i: int) -> None:
+        session = requests.Session()
+        session.headers["Accept-Encoding"] = "gzip"
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                resp = session.get(url, timeout=30)
+                resp.content
+                status = str(resp.status_code)
+            except requests.RequestException:
+                errors[i] += 1
+                status = "error"
+            latencies[i].append(time.perf_counter() - started)
+            statuses[i][status] = statuses[i].get(status, 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    values = sorted(v for per_client in latencies for v in per_client)
+    status_counts: dict[str, int] = {}
+    for per_client in statuses:
+        for status, n in per_client.items():
+            status_counts[status] = status_counts.get(status, 0) + n
+    ms = lambda v: round(v * 1000, 3)  # noqa: E731
+    return {
+        "requests": len(values),
+        "errors": sum(errors),
+        "status": status_counts,
+        "elapsed": round(elapsed, 3),
+        "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": ms(statistics.fmean(values)) if values else 0.0,
+        "p50_ms": ms(_percentile(values, 50)),
+        "p95_ms": ms(_percentile(values, 95)),
+        "p99_ms": ms(_percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else 0.0,
+    }
+
+
+def compare(current: dict, previous: dict) -> None:
+    print(f"\nvs {previous.get('revision', '?')} ({previous.get('started', '?')})")
+    for endpoint, now in current["results"].items():
+        before = previous.get("results", {}).get(endpoint)
+        if not before:
+            print(f"  {endpoint}: no previous result")
+            continue
+        parts = []
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms", "upstream_calls"):
+            old, new = before.get(key), now.get(key)
+            if not old or new is None:
+                continue
+            parts.append(f"{key} {old} -> {new} ({(new - old) / old * 100:+.1f}%)")
+        print(f"  {endpoint}: " + ", ".join(parts))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per endpoint")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds to let caches and the collector settle")
+    parser.add_argument("--endpoints", default="/api/metrics,/api/stats,/api/smart")
+    parser.add_argument("--app-port", type=int, default=0, help="default: a free port")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for app.py, e.g. --env METRICS_INTERVAL=1")
+    parser.add_argument("--out", default=None, help="results file (default: bench-<revision>-<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to diff against")
+    fake_upstreams.add_arguments(parser)
+    parser.set_defaults(truenas_port=0, netdata_port=0)
+    args = parser.parse_args()
+
+    truenas_port = args.truenas_port or _free_port()
+    netdata_port = args.netdata_port or _free_port()
+    app_port = args.app_port or _free_port()
+    upstream = fake_upstreams.from_arguments(args)
+    servers = fake_upstreams.serve(upstream, truenas_port, netdata_port)
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    base_url = f"http://127.0.0.1:{app_port}"
+
+    results: dict[str, dict] = {}
+    started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with tempfile.TemporaryDirectory(prefix="dash-bench-") as data_dir:
+        proc = start_app(app_port, truenas_port, netdata_port, data_dir, extra_env)
+        try:
+            wait_ready(base_url, proc)
+            for endpoint in (e.strip() for e in args.endpoints.split(",") if e.strip()):
+                requests.get(f"{base_url}{endpoint}", timeout=30)
+                time.sleep(args.warmup)
+                upstream.reset()
+                result = run_endpoint(f"{base_url}{endpoint}", args.clients, args.duration)
+                calls = upstream.stats()
+                result["upstream"] = calls["requests"]
+                result["upstream_failures"] = calls["failures"]
+                result["upstream_calls"] = sum(calls["requests"].values())
+                results[endpoint] = result
+                print(f"{endpoint:<16} {result['rps']:>9.1f} req/s  p50 {result['p50_ms']:>8.2f} ms  "
+                      f"p95 {result['p95_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms  "
+                      f"errors {result['errors']}  upstream {result['upstream_calls']}", flush=True)
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            for server in servers:
+                server.shutdown()
+
+    revision = _git_revision()
+    report = {
+        "revision": revision,
+        "started": started_at,
+        "python": sys.version.split()[0],
+        "config": {
+            "clients": args.clients,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "failure_rate": args.failure_rate,
+            "disks": args.disks,
+            "datasets": args.datasets,
+            "allmetrics": not args.no_allmetrics,
+            "env": extra_env,
+        },
+        "results": results,
+    }
+    out = Path(args.out or f"bench-{revision}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    out.write_text(json.dumps(report, indent=2))
+    print(f"results written to {out}")
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Stand-in for nvidia-smi's query/loop mode, for running the GPU sampler without a GPU.
+
+Usage: NVIDIA_SMI_BIN=tools/fake_nvidia_smi.py python app.py
+
+Supports --query-gpu / --query-compute-apps with --format=csv,noheader,nounits and
+--loop-ms. FAKE_GPU_COUNT (default 2) and FAKE_GPU_APPS (default 1 per GPU) shape the output;
+FAKE_GPU_ROUNDS makes a --loop-ms run exit after that many rounds, like a crashed nvidia-smi.
+"""
+import itertools
+import os
+import random
+import sys
+import time
+
+GPU_COUNT = int(os.getenv("FAKE_GPU_COUNT", "2"))
+APPS_PER_GPU = int(os.getenv("FAKE_GPU_APPS", "1"))
+ROUNDS = int(os.getenv("FAKE_GPU_ROUNDS", "0"))
+MEMORY_TOTAL = 7680
+
+
+def gpu_field(field: str, i: int) -> str:
+    if field == "index":
+        return str(i)
+    if field == "uuid":
+        return f"GPU-fake-{i:04d}"
+    if field == "name":
+        return "Fake Tesla P4"
+    if field == "utilization.gpu":
+        return str(random.randint(0, 100))
+    if field == "temperature.gpu":
+        return str(random.randint(35, 80))
+    if field == "memory.used":
+        return str(random.randint(0, MEMORY_TOTAL))
+    if field == "memory.total":
+        return str(MEMORY_TOTAL)
+    return "[N/A]"
+
+
+def app_field(field: str, i: int, n: int, stamp: str) -> str:
+    if field == "timestamp":
+        return stamp
+    if field == "gpu_uuid":
+        return f"GPU-fake-{i:04d}"
+    if field == "pid":
+        return str(1000 + i * 100 + n)
+    if field == "process_name":
+        return f"/usr/bin/fake-worker-{n}"
+    if field == "used_memory":
+        return str(random.randint(100, 2000))
+    return "[N/A]"
+
+
+def main(argv: list[str]) -> int:
+    opts = dict(a.split("=", 1) if "=" in a else (a, "") for a in argv)
+    loop_ms = int(opts.get("--loop-ms") or opts.get("-lms") or 0)
+    for round_ in itertools.count(1):
+        stamp = time.strftime("%Y/%m/%d %H:%M:%S.") + f"{int(time.time() * 1000) % 1000:03d}"
+        if "--query-gpu" in opts:
+            fields = opts["--query-gpu"].split(",")
+            for i in range(GPU_COUNT):
+                print(", ".join(gpu_field(f, i) for f in fields))
+        elif "--query-compute-apps" in opts:
+            fields = opts["--query-compute-apps"].split(",")
+            for i in range(GPU_COUNT):
+                for n in range(APPS_PER_GPU):
+                    print(", ".join(app_field(f, i, n, stamp) for f in fields))
+        else:
+            print("fake nvidia-smi: only --query-gpu / --query-compute-apps are supported", file=sys.stderr)
+            return 2
+        sys.stdout.flush()
+        if not loop_ms or round_ == ROUNDS:
+            return 0
+        time.sleep(loop_ms / 1000.0)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Stand-in for the TrueNAS 25.x WebSocket JSON-RPC API (/api/current).
+
+Usage: python tools/fake_truenas_ws.py [--port 18090] [--api-key KEY] [--interval 1]
+                                       [--change-every 0] [--drop-every 0]
+
+Then run the dashboard with TRUENAS_HOST=127.0.0.1 TRUENAS_PORT=18090 TRUENAS_SCHEME=http.
+
+Implements auth.login_with_api_key, core.ping, core.subscribe / core.unsubscribe and
+system.info. Subscribers to reporting.realtime get a random sample every --interval
+seconds; pool.query / disk.query subscribers get a "changed" event every
+--change-every seconds. --drop-every closes every connection periodically to
+exercise the client's reconnect and resubscribe path.
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import itertools
+import json
+import random
+import time
+
+from eventlet import websocket, wsgi
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--port", type=int, default=18090)
+parser.add_argument("--api-key", default="", help="accept only this key (default: any)")
+parser.add_argument("--interval", type=float, default=1.0)
+parser.add_argument("--change-every", type=float, default=0.0)
+parser.add_argument("--drop-every", type=float, default=0.0)
+args = parser.parse_args()
+
+sub_ids = itertools.count(1)
+stats = {"connections": 0, "logins": 0, "subscribes": 0, "calls": 0}
+
+
+def realtime_fields() -> dict:
+    total = 64 * 1024 ** 3
+    return {
+        "cpu": {"cpu": {"usage": round(random.uniform(0, 100), 2)}},
+        "memory": {
+            "physical_memory_total": total,
+            "physical_memory_available": int(total * random.uniform(0.2, 0.6)),
+            "arc_size": int(total * 0.25),
+        },
+        "interfaces": {
+            iface: {
+                "received_bytes_rate": round(random.uniform(0, 1e7), 1),
+                "sent_bytes_rate": round(random.uniform(0, 1e7), 1),
+                "link_state": "LINK_STATE_UP",
+            }
+            for iface in ("eno1", "enp3s0")
+        },
+        "disks": {
+            "read_bytes": round(random.uniform(0, 5e7), 1),
+            "write_bytes": round(random.uniform(0, 5e7), 1),
+            "read_ops": random.randint(0, 500),
+            "write_ops": random.randint(0, 500),
+            "busy": round(random.uniform(0, 100), 1),
+        },
+    }
+
+
+@websocket.WebSocketWSGI
+def handle(ws):
+    stats["connections"] += 1
+    authed = False
+    subs: dict[str, str] = {}  # collection -> subscription id
+    opened = time.time()
+
+    def send(obj):
+        ws.send(json.dumps(obj))
+
+    def pusher():
+        last_change = time.time()
+        while True:
+            eventlet.sleep(args.interval)
+            if args.drop_every and time.time() - opened > args.drop_every:
+                ws.close()
+                return
+            if "reporting.realtime" in subs:
+                send({"jsonrpc": "2.0", "method": "collection_update",
+                      "params": {"msg": "added", "collection": "reporting.realtime", "fields": realtime_fields()}})
+            if args.change_every and time.time() - last_change >= args.change_every:
+                last_change = time.time()
+                for collection in ("pool.query", "disk.query"):
+                    if collection in subs:
+                        send({"jsonrpc": "2.0", "method": "collection_update",
+                              "params": {"msg": "changed", "collection": collection, "id": 1, "fields": {}}})
+
+    push = eventlet.spawn(pusher)
+    try:
+        while True:
+            raw = ws.wait()
+            if raw is None:
+                return
+            msg = json.loads(raw)
+            method, params, msg_id = msg.get("method"), msg.get("params") or [], msg.get("id")
+            stats["calls"] += 1
+            if method == "auth.login_with_api_key":
+                authed = bool(params) and (not args.api_key or params[0] == args.api_key)
+                stats["logins"] += authed
+                result = authed
+            elif not authed:
+                send({"jsonrpc": "2.0", "id": msg_id, "error": {"code": 13, "message": "Not authenticated"}})
+                continue
+            elif method == "core.ping":
+                result = "pong"
+            elif method == "core.subscribe":
+                stats["subscribes"] += 1
+                subs[params[0]] = result = str(next(sub_ids))
+            elif method == "core.unsubscribe":
+                subs = {k: v for k, v in subs.items() if v != params[0]}
+                result = None
+            elif method == "system.info":
+                result = {"hostname": "fake-truenas", "uptime_seconds": int(time.time() - opened), "stats": dict(stats)}
+            else:
+                send({"jsonrpc": "2.0", "id": msg_id, "error": {"code": -32601, "message": f"Method not found: {method}"}})
+                continue
+            send({"jsonrpc": "2.0", "id": msg_id, "result": result})
+    finally:
+        push.kill()
+
+
+def app(environ, start_response):
+    if environ["PATH_INFO"] == "/api/current":
+        return handle(environ, start_response)
+    start_response("404 Not Found", [("Content-Type", "text/plain")])
+    return [b"not found"]
+
+
+if __name__ == "__main__":
+    wsgi.server(eventlet.listen(("127.0.0.1", args.port)), app, log_output=False)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""Stand-in TrueNAS REST and Netdata servers for benchmarking the dashboard.
+
+Usage: python tools/fake_upstreams.py [--truenas-port 18100] [--netdata-port 18101]
+                                      [--latency-ms 20] [--jitter-ms 10] [--failure-rate 0]
+                                      [--disks 8] [--datasets 50] [--no-allmetrics]
+
+Then run the dashboard with TRUENAS_HOST=127.0.0.1 TRUENAS_PORT=18100 TRUENAS_SCHEME=http
+TRUENAS_API_KEY=x NETDATA_URL=http://127.0.0.1:18101 TRUENAS_WS=0.
+
+TrueNAS serves system/info, pool, pool/dataset, disk, disk/temperatures,
+reporting/get_data and smart/test/results; Netdata serves /api/v1/data,
+/api/v1/allmetrics and /api/v1/charts. Every response is delayed by
+--latency-ms plus up to --jitter-ms, and --failure-rate of them return 500.
+GET /_stats returns request counts per "METHOD path"; POST /_reset clears them.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+NETDATA_DIMENSIONS = {
+    "system.cpu": ["user", "system", "iowait", "idle"],
+    "system.ram": ["free", "used", "cached", "buffers"],
+}
+
+
+class FakeUpstream:
+    """Request counters and fault injection shared by both fake servers."""
+
+    def __init__(self, latency_ms: float = 20, jitter_ms: float = 10, failure_rate: float = 0.0,
+                 disks: int = 8, datasets: int = 50, allmetrics: bool = True, seed: int | None = None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.failure_rate = failure_rate
+        self.allmetrics = allmetrics
+        self.random = random.Random(seed)
+        self.counts = Counter()
+        self.failures = Counter()
+        self._lock = threading.Lock()
+        self.disks = [
+            {"name": f"sd{chr(97 + i)}", "model": "WDC WD40EFRX" if i % 2 else "Samsung SSD 870",
+             "serial": f"SN{i:04d}", "size": 4_000_787_030_016, "type": "HDD" if i % 2 else "SSD"}
+            for i in range(disks)
+        ]
+        self.datasets = [
+            {"name": "storage", "mountpoint": "/mnt/storage",
+             "used": {"parsed": 4.2e12}, "available": {"parsed": 6.1e12}},
+            {"name": "Apps", "mountpoint": "/mnt/Apps",
+             "used": {"parsed": 1.1e11}, "available": {"parsed": 1.4e11}},
+        ] + [
+            {"name": f"storage/ds{i}", "mountpoint": f"/mnt/storage/ds{i}",
+             "used": {"parsed": i * 1e9}, "available": {"parsed": 6.1e12},
+             "properties": {k: {"value": str(i), "source": "DEFAULT"} for k in ("compression", "atime", "recordsize", "quota")}}
+            for i in range(max(0, datasets - 2))
+        ]
+
+    def begin(self, method: str, path: str) -> bool:
+        """Count the request and sleep for the configured latency; False means fail it."""
+        key = f"{method} {path}"
+        with self._lock:
+            self.counts[key] += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.failure_rate
+            if failed:
+                self.failures[key] += 1
+        if delay > 0:
+            time.sleep(delay)
+        return not failed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": dict(self.counts), "failures": dict(self.failures)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts.clear()
+            self.failures.clear()
+
+    # --- TrueNAS ---
+
+    def truenas_get(self, path: str, query: dict):
+        if path == "/api/v2.0/system/info":
+            return {"hostname": "truenas", "version": "TrueNAS-SCALE-24.10", "uptime_seconds": 123456.7,
+                    "loadavg": [0.42, 0.38, 0.35], "cpu_model": "Intel(R) Xeon(R) CPU E3-1230 v3 @ 3.30GHz",
+                    "cores": 8, "physmem": 34359738368}
+        if path == "/api/v2.0/pool":
+            return [{"name": "storage", "status": "ONLINE", "healthy": True},
+                    {"name": "Apps", "status": "ONLINE", "healthy": True}]
+        if path == "/api/v2.0/pool/dataset":
+            mountpoint = query.get("mountpoint", [None])[0]
+            name = query.get("name", [None])[0]
+            return [d for d in self.datasets
+                    if (mountpoint is None or d["mountpoint"] == mountpoint) and (name is None or d["name"] == name)]
+        if path == "/api/v2.0/disk":
+            return self.disks
+        if path == "/api/v2.0/smart/test/results":
+            return [{"disk": d["name"], "status": "SUCCESS", "type": "SHORT", "lifetime": 20000 + i}
+                    for i, d in enumerate(self.disks)]
+        return None
+
+    def truenas_post(self, path: str, body: dict):
+        if path == "/api/v2.0/disk/temperatures":
+            names = body.get("names") if isinstance(body, dict) else None
+            return {d["name"]: self.random.randint(28, 45) for d in self.disks if not names or d["name"] in names}
+        if path == "/api/v2.0/reporting/get_data":
+            now = int(time.time())
+            times = list(range(now - 60, now, 10))
+            return [{"name": "interface", "legend": ["time", "rx", "tx"],
+                     "data": [times, [self.random.uniform(0, 1e5) for _ in times], [self.random.uniform(0, 1e5) for _ in times]]}]
+        return None
+
+    # --- Netdata ---
+
+    def netdata_get(self, path: str, query: dict):
+        if path in ("/api/v1/data", "/api/v3/data"):
+            chart = query.get("chart", query.get("contexts", [""]))[0]
+            dims = NETDATA_DIMENSIONS.get(chart, ["received", "sent"])
+            return {"labels": ["time"] + dims,
+                    "data": [[int(time.time())] + [round(self.random.uniform(0, 100), 2) for _ in dims]]}
+        if path == "/api/v1/allmetrics" and self.allmetrics:
+            charts = query.get("filter", [""])[0].split()
+            return {chart: {"name": chart, "dimensions": {
+                d: {"name": d, "value": round(self.random.uniform(0, 100), 2)}
+                for d in NETDATA_DIMENSIONS.get(chart, ["received", "sent"])}} for chart in charts}
+        if path == "/api/v1/charts":
+            return {"charts": {chart: {"id": chart, "dimensions": {d: {} for d in dims}}
+                               for chart, dims in NETDATA_DIMENSIONS.items()}}
+        return None
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients dropping keep-alive connections at shutdown are expected
+        if not isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            super().handle_error(request, client_address)
+
+
+def _handler(upstream: FakeUpstream, kind: str):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, obj, status: int = 200) -> None:
+            body = json.dumps(obj).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _dispatch(self, method: str, body=None) -> None:
+            url = urlparse(self.path)
+            if url.path == "/_stats":
+                return self._send(upstream.stats())
+            if url.path == "/_reset":
+                upstream.reset()
+                return self._send({"ok": True})
+            if not upstream.begin(method, url.path):
+                return self._send({"error": "injected failure"}, 500)
+            query = parse_qs(url.query)
+            if kind == "netdata":
+                result = upstream.netdata_get(url.path, query) if method == "GET" else None
+            elif method == "GET":
+                result = upstream.truenas_get(url.path, query)
+            else:
+                result = upstream.truenas_post(url.path, body)
+            if result is None:
+                return self._send({"error": "not found"}, 404)
+            self._send(result)
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                body = json.loads(raw) if raw else None
+            except ValueError:
+                body = None
+            self._dispatch("POST", body)
+
+    return Handler
+
+
+def serve(upstream: FakeUpstream, truenas_port: int, netdata_port: int,
+          host: str = "127.0.0.1") -> list[ThreadingHTTPServer]:
+    """Start both servers on daemon threads and return them (call .shutdown() to stop)."""
+    servers = []
+    for kind, port in (("truenas", truenas_port), ("netdata", netdata_port)):
+        server = _QuietServer((host, port), _handler(upstream, kind))
+        threading.Thread(target=server.serve_forever, name=f"fake-{kind}", daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--truenas-port", type=int, default=18100)
+    parser.add_argument("--netdata-port", type=int, default=18101)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of upstream requests that return 500")
+    parser.add_argument("--disks", type=int, default=8)
+    parser.add_argument("--datasets", type=int, default=50)
+    parser.add_argument("--no-allmetrics", action="store_true", help="404 /api/v1/allmetrics like older Netdata")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def from_arguments(args: argparse.Namespace) -> FakeUpstream:
+    return FakeUpstream(args.latency_ms, args.jitter_ms, args.failure_rate,
+                        args.disks, args.datasets, not args.no_allmetrics, args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    serve(from_arguments(args), args.truenas_port, args.netdata_port)
+    print(f"fake TrueNAS on :{args.truenas_port}, fake Netdata on :{args.netdata_port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass